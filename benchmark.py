@@ -0,0 +1,361 @@
+"""Headless benchmarks for the scheduler core: throughput, start drift, launch overhead, idle CPU and memory.
+
+Each scenario runs in a fresh subprocess and scratch directory against a real SchedulerCore running
+real script processes, so its peak memory and CPU figures are its own. Results are printed and can
+be written as JSON to compare across commits:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json --max-regression 20
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCALES = {  # Workload sizes per scenario
+    "quick": {"registry_jobs": 1000, "burst_jobs": 50, "output_scripts": 2, "output_mb": 10, "long_scripts": 4,
+              "long_seconds": 2, "idle_seconds": 2},
+    "full": {"registry_jobs": 10000, "burst_jobs": 500, "output_scripts": 4, "output_mb": 50, "long_scripts": 16,
+             "long_seconds": 5, "idle_seconds": 5},
+}
+BURST_LEAD_SECONDS = 3  # How far ahead the burst is scheduled, so all of it is registered before it is due
+SCENARIO_TIMEOUT = 600  # Seconds before a scenario subprocess is abandoned
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+MEASURED_SUFFIXES = ("_per_sec", "_ms", "_seconds", "_percent", "_mb")  # Compared metrics; the rest describe the load
+HIGHER_IS_BETTER = ("_per_sec",)  # Metric name suffixes where a bigger number is an improvement
+
+
+def _percentile(values, q):
+    """Linearly interpolated q-quantile (0..1) of the values, or None if there are none."""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT / 2 ** 20, 1)
+
+
+def _write_script(path, body):
+    with open(path, "w") as file:
+        file.write(body)
+    return os.path.abspath(path)
+
+
+def _core(workers=None, mode=None):
+    """A SchedulerCore working in the current (scratch) directory."""
+    import scheduler_core
+    from run_history import RunHistory
+    scheduler_core.PYTHON_INTERPRETER = sys.executable  # Not whichever python is first on PATH, if any
+    if workers is not None:
+        scheduler_core.MAX_WORKERS = workers
+    if mode is not None:
+        scheduler_core.EXECUTION_MODE = mode
+    return scheduler_core.SchedulerCore("scripts.json", RunHistory("run_history.db"))
+
+
+def _wait_for_runs(core, count, since, timeout=SCENARIO_TIMEOUT):
+    """Collect the dicts of the next `count` finished runs from the core's event log."""
+    runs = []
+    deadline = time.monotonic() + timeout
+    while len(runs) < count:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Only {len(runs)} of {count} runs finished within {timeout} s")
+        for event in core.events.since(since, timeout=1):
+            since = event["seq"]
+            if event["kind"] == "run_finished":
+                runs.append(event["run"])
+    return runs
+
+
+def bench_registry(size):
+    """Thousands of registered, scheduled jobs: registry and timer costs, and idle CPU while waiting."""
+    from script_registry import ScriptRegistry
+    count = size["registry_jobs"]
+    now = datetime.now()
+    # Spread over every trigger type, none of them due during the run
+    later = now + timedelta(hours=12)
+    specs = [later.strftime("%H:%M"), "every 6h", f"{later.minute} {later.hour} * * *",
+             (now + timedelta(days=1)).strftime("%Y-%m-%d %H:%M")]
+    core = _core()
+    try:
+        started = time.perf_counter()
+        scripts = [core.add_script(os.path.abspath(f"job_{index}.py"), specs[index % len(specs)])
+                   for index in range(count)]
+        add_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for script in scripts:
+            core.schedule_script(script["id"])
+        schedule_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        core.registry.save()
+        save_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        core.list_scripts()
+        list_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ScriptRegistry("scripts.json")
+        load_seconds = time.perf_counter() - started
+
+        core.timer.clear()
+        started = time.perf_counter()
+        core.restore_jobs()
+        restore_seconds = time.perf_counter() - started
+
+        core.start_scheduler()
+        time.sleep(0.5)  # Let startup work settle before measuring idle
+        cpu_before, wall_before = time.process_time(), time.perf_counter()
+        time.sleep(size["idle_seconds"])
+        idle_cpu = (time.process_time() - cpu_before) / (time.perf_counter() - wall_before)
+        return {
+            "jobs": count,
+            "add_per_sec": round(count / add_seconds),
+            "schedule_per_sec": round(count / schedule_seconds),
+            "save_ms": _ms(save_seconds),
+            "load_ms": _ms(load_seconds),
+            "restore_jobs_ms": _ms(restore_seconds),
+            "list_scripts_ms": _ms(list_seconds),
+            "idle_cpu_percent": round(idle_cpu * 100, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    finally:
+        core.shutdown()
+
+
+def _bench_burst(size, mode):
+    count = size["burst_jobs"]
+    core = _core(mode=mode)
+    try:
+        due = (datetime.now() + timedelta(seconds=BURST_LEAD_SECONDS)).replace(microsecond=0)
+        spec = due.strftime("%Y-%m-%d %H:%M:%S")
+        for index in range(count):
+            script = core.add_script(_write_script(f"burst_{index}.py", "pass\n"))
+            core.schedule_script(script["id"], spec)
+        since = core.events.last_seq
+        core.start_scheduler()
+        runs = _wait_for_runs(core, count, since)
+        if datetime.now() < due:
+            raise RuntimeError("Runs finished before they were due")
+        last_start = max(datetime.fromisoformat(run["started_at"]) for run in runs)
+        last_finish = max(datetime.fromisoformat(run["finished_at"]) for run in runs)
+        drift = [run["drift"] for run in runs]
+        launch = [run["launch_latency"] for run in runs]
+        duration = [run["duration"] for run in runs]  # Includes interpreter startup, unlike the launch overhead
+        return {
+            "jobs": count,
+            "workers": core.engine.max_workers,
+            "mode": mode,
+            "jobs_per_sec": round(count / max((last_start - due).total_seconds(), 1e-6), 1),
+            "drift_p50_ms": _ms(_percentile(drift, 0.5)),
+            "drift_p99_ms": _ms(_percentile(drift, 0.99)),
+            "drift_max_ms": _ms(max(drift)),
+            "launch_p50_ms": _ms(_percentile(launch, 0.5)),
+            "launch_p99_ms": _ms(_percentile(launch, 0.99)),
+            "run_p50_ms": _ms(_percentile(duration, 0.5)),
+            "run_p99_ms": _ms(_percentile(duration, 0.99)),
+            "burst_seconds": round((last_finish - due).total_seconds(), 3),
+            "failed_runs": sum(1 for run in runs if run["status"] != "finished" or run["returncode"] != 0),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    finally:
+        core.shutdown()
+
+
+def bench_burst(size):
+    """A burst of jobs all due on the same second, started as fresh interpreters."""
+    from executor import MODE_COLD
+    return _bench_burst(size, MODE_COLD)
+
+
+def bench_burst_warm(size):
+    """The same burst, forked from a pre-warmed interpreter."""
+    from executor import MODE_WARM
+    return _bench_burst(size, MODE_WARM)
+
+
+def bench_large_output(size):
+    """Scripts writing tens of megabytes to stdout at once: capture throughput and scheduler memory."""
+    count, megabytes = size["output_scripts"], size["output_mb"]
+    body = ("import sys\nline = ('x' * 1023 + '\\n').encode()\n"
+            f"for _ in range({megabytes} * 1024):\n    sys.stdout.buffer.write(line)\n")
+    core = _core(workers=count)
+    try:
+        paths = [_write_script(f"output_{index}.py", body) for index in range(count)]
+        scripts = [core.add_script(path) for path in paths]
+        rss_before = _peak_rss_mb()
+        since = core.events.last_seq
+        started = time.perf_counter()
+        for script in scripts:
+            core.run_script(script["id"])
+        runs = _wait_for_runs(core, count, since)
+        elapsed = time.perf_counter() - started
+        logged = sum(os.path.getsize(run["log_path"]) for run in runs if run["log_path"])
+        return {
+            "scripts": count,
+            "output_megabytes": count * megabytes,
+            "output_mb_per_sec": round(logged / 2 ** 20 / elapsed, 1),
+            "logged_megabytes": round(logged / 2 ** 20, 1),
+            "peak_rss_mb": _peak_rss_mb(),
+            "rss_growth_mb": round(_peak_rss_mb() - rss_before, 1),
+        }
+    finally:
+        core.shutdown()
+
+
+def bench_long_running(size):
+    """Long-running scripts, half of them killed by timeouts: scheduler CPU while waiting, and kill accuracy."""
+    count, seconds = size["long_scripts"], size["long_seconds"]
+    timeout = seconds / 2
+    core = _core(workers=count)
+    try:
+        scripts = []
+        for index in range(count):
+            script = core.add_script(_write_script(f"long_{index}.py", f"import time\ntime.sleep({seconds})\n"))
+            if index % 2:
+                core.registry.update(script["id"], timeout=timeout)
+            scripts.append(script)
+        since = core.events.last_seq
+        cpu_before, wall_before = time.process_time(), time.perf_counter()
+        for script in scripts:
+            core.run_script(script["id"])
+        runs = _wait_for_runs(core, count, since)
+        busy_cpu = (time.process_time() - cpu_before) / (time.perf_counter() - wall_before)
+        timed_out = [run for run in runs if run["status"] == "timed out"]
+        overshoot = [run["duration"] - timeout for run in timed_out]
+        return {
+            "scripts": count,
+            "timed_out": len(timed_out),
+            "expected_timed_out": count // 2,
+            "timeout_overshoot_p99_ms": _ms(_percentile(overshoot, 0.99)),
+            "scheduler_cpu_percent": round(busy_cpu * 100, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    finally:
+        core.shutdown()
+
+
+SCENARIOS = {
+    "registry": bench_registry,
+    "burst": bench_burst,
+    "burst_warm": bench_burst_warm,
+    "large_output": bench_large_output,
+    "long_running": bench_long_running,
+}
+
+
+def run_scenario(name, scale):
+    """Run one scenario in a subprocess and scratch directory. Returns its metrics, or {"error": ...}."""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix=f"scheduler-bench-{name}-") as scratch:
+        try:
+            result = subprocess.run([sys.executable, os.path.join(package_dir, "benchmark.py"), "--run-scenario",
+                                     name, "--scale", scale], cwd=scratch, capture_output=True, text=True,
+                                    timeout=SCENARIO_TIMEOUT, env=dict(os.environ, PYTHONPATH=package_dir))
+        except subprocess.TimeoutExpired:
+            return {"error": f"Timed out after {SCENARIO_TIMEOUT} s"}
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else
+                f"Exited with {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression=None):
+    """Print each metric's change against the baseline. Returns the regressions beyond max_regression percent.
+
+    Runs that failed are always a regression: a burst of failures is fast, so the timings alone would not tell.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created')}):")
+    if baseline.get("scale") != results["scale"] or baseline.get("cpu_count") != results["cpu_count"]:
+        print(f"  Baseline ran at scale {baseline.get('scale')} on {baseline.get('cpu_count')} CPUs; "
+              f"not flagging regressions")
+        max_regression = None
+    for scenario, metrics in results["scenarios"].items():
+        if metrics.get("failed_runs"):
+            print(f"  {scenario}.failed_runs: {metrics['failed_runs']}  REGRESSION")
+            regressions.append(f"{scenario}.failed_runs")
+        old_metrics = baseline.get("scenarios", {}).get(scenario, {})
+        for name, value in metrics.items():
+            old = old_metrics.get(name)
+            if not name.endswith(MEASURED_SUFFIXES) or not isinstance(value, (int, float)) or not old:
+                continue
+            change = (value - old) / abs(old) * 100
+            worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if max_regression is not None and worse > max_regression:
+                flag = "  REGRESSION"
+                regressions.append(f"{scenario}.{name}")
+            print(f"  {scenario}.{name}: {old} -> {value} ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduler core without the GUI.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="full")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default all)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, exit with status 1 if any metric got worse by more than this percent")
+    parser.add_argument("--run-scenario", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        # Child process: run in the scratch directory and report on stdout
+        print(json.dumps(SCENARIOS[args.run_scenario](SCALES[args.scale])))
+        return 0
+
+    results = {
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "scenarios": {},
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f"{name}:", flush=True)
+        metrics = results["scenarios"][name] = run_scenario(name, args.scale)
+        for key, value in metrics.items():
+            print(f"  {key}: {value}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.max_regression):
+            return 1
+    return 1 if any("error" in metrics for metrics in results["scenarios"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""Headless scheduler daemon exposing a local HTTP control API.
+
+Listens on a Unix socket (the default, readable only by the current user) or on a loopback TCP
+address. Over TCP every request must carry the token the daemon writes to TOKEN_FILE (readable only
+by the current user) as "Authorization: Bearer <token>". POST bodies must be sent as application/json,
+which browsers cannot do cross-origin without a CORS preflight the daemon never grants. Endpoints
+take and return JSON:
+
+    GET  /status                      daemon, scheduler and worker pool status
+    GET  /scripts                     registered scripts
+    POST /scripts/add                 {"file_path", "time"?} -> {"added", "script"}
+    POST /scripts/remove              {"id"} or {"file_path"}
+    POST /scripts/schedule            {"id"} or {"file_path"}, with optional "time"
+    POST /scripts/run                 {"id"} or {"file_path"} -> {"run": {...}} or {"run": null} if skipped
+    POST /scripts/pipeline            {"id"} or {"file_path"}, with optional "depends_on" (ids or file paths),
+                                      "inputs" and "outputs" (file paths)
+    GET  /pipeline                    scripts in dependency order with their links and step status
+    POST /pipeline/rerun-failed       run every failed step -> {"runs": [...]}
+    GET  /jobs                        scheduled jobs and their next fire times
+    POST /jobs/clear
+    POST /scheduler/start
+    GET  /events?since=N&timeout=S    long-poll for events newer than sequence number N
+    GET  /runs?search=&status=&before=&after=&limit=
+                                      a page of run history (before/after are "started_at,id")
+    GET  /runs/<run_id>/output        stream a run's output as plain text until the run ends
+    GET  /output?path=&max_bytes=     the tail of a run output file
+    GET  /stats                       per-script run statistics and recent alerts
+    GET  /metrics                     the same metrics in the Prometheus text format
+    POST /shutdown
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from run_history import read_output_tail
+from scheduler_core import SchedulerCore, run_to_dict
+
+DEFAULT_ADDRESS = "scheduler.sock"
+TOKEN_FILE = "scheduler.token"  # API token for TCP clients, rewritten each time a daemon starts listening on TCP
+MAX_EVENT_WAIT = 30  # Seconds a long-poll may block
+STREAM_POLL_INTERVAL = 0.1  # Seconds between checks for new output while streaming a running script
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def parse_address(address):
+    """Return ("tcp", (host, port)) for "host:port" or ("unix", path) for anything else."""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return "tcp", (host, int(port))
+    return "unix", address
+
+
+def _check_loopback(host):
+    if host == "localhost":
+        return
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError(f"The control API only listens on loopback addresses, not {host}")
+
+
+def read_token(path=TOKEN_FILE):
+    """Return the API token a TCP daemon wrote, or None if there is none."""
+    try:
+        with open(path) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_token(path):
+    """Write a fresh token to a file only the current user can read, and return it."""
+    token = secrets.token_urlsafe(32)
+    if os.path.exists(path):
+        os.unlink(path)  # Recreate rather than rewrite, so a file with looser permissions is not reused
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as file:
+        file.write(token)
+    return token
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ScriptScheduler/1.0"
+
+    @property
+    def core(self):
+        return self.server.core
+
+    def log_message(self, format, *args):
+        pass  # Keep the daemon's output for real problems
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if not self._authorized():
+            self._send_json({"error": "Missing or wrong API token"}, 401)
+            return
+        try:
+            body = self._read_body() if method == "POST" else {}
+            if method == "GET" and len(parts) == 3 and parts[0] == "runs" and parts[2] == "output":
+                self._stream_output(int(parts[1]))
+                return
+            if method == "GET" and parts == ["metrics"]:
+                self._send_text(self.core.metrics_text(), "text/plain; version=0.0.4; charset=utf-8")
+                return
+            handler = ROUTES.get((method, "/" + "/".join(parts)))
+            if handler is None:
+                self._send_json({"error": f"No such endpoint: {method} {url.path}"}, 404)
+                return
+            self._send_json(handler(self, query, body))
+        except KeyError as e:
+            self._send_json({"error": str(e.args[0]) if e.args else "Not found"}, 404)
+        except (ValueError, TypeError) as e:
+            self._send_json({"error": str(e)}, 400)
+        except Exception as e:
+            self._send_json({"error": f"{type(e).__name__}: {e}"}, 500)
+
+    def _authorized(self):
+        if self.server.token is None:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.server.token}")
+
+    def _read_body(self):
+        # Browsers send cross-origin POSTs without a preflight only for form and text/plain bodies
+        if self.headers.get_content_type() != "application/json":
+            raise ValueError("Request body must be sent as application/json")
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object")
+        return body
+
+    def _send_json(self, payload, status=200):
+        self._send_text(json.dumps(payload), "application/json", status)
+
+    def _send_text(self, text, content_type, status=200):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_output(self, run_id):
+        """Follow the run's output file until the run ends. The response ends when the connection closes."""
+        run = self.core.get_run(run_id)
+        while run.log_path is None and not run.done.is_set():
+            time.sleep(STREAM_POLL_INTERVAL)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.end_headers()
+        if run.log_path is None or not os.path.exists(run.log_path):
+            return
+        with open(run.log_path, "rb") as file:
+            while True:
+                finished = run.done.is_set()
+                chunk = file.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    try:
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        return  # The client stopped following
+                elif finished:
+                    return
+                else:
+                    time.sleep(STREAM_POLL_INTERVAL)
+
+
+def _field(body, name):
+    if not body.get(name):
+        raise ValueError(f"Missing field: {name}")
+    return body[name]
+
+
+def _script_id(handler, body):
+    """Return the id of the script a request names, by "id" or by "file_path"."""
+    if not body.get("id") and not body.get("file_path"):
+        raise ValueError("Missing field: id or file_path")
+    return handler.core.resolve(body.get("id"), body.get("file_path"))["id"]
+
+
+def _add_script(handler, query, body):
+    script = handler.core.add_script(_field(body, "file_path"), body.get("time"))
+    return {"added": script is not None, "script": script}
+
+
+def _run_script(handler, query, body):
+    run = handler.core.run_script(_script_id(handler, body))
+    return {"run": run_to_dict(run) if run is not None else None}
+
+
+def _set_pipeline(handler, query, body):
+    for name in ("depends_on", "inputs", "outputs"):
+        if body.get(name) is not None and not isinstance(body[name], list):
+            raise ValueError(f"{name} must be a list")
+    return {"script": handler.core.set_pipeline(_script_id(handler, body), body.get("depends_on"),
+                                                body.get("inputs"), body.get("outputs"))}
+
+
+def _history_key(value):
+    if not value:
+        return None
+    started_at, run_id = value.split(",")
+    return float(started_at), int(run_id)
+
+
+def _output_tail(handler, query, body):
+    path = os.path.realpath(_field(query, "path"))
+    log_dir = os.path.realpath(handler.core.engine.log_dir)
+    if os.path.commonpath([path, log_dir]) != log_dir:
+        raise ValueError("Only run output files can be read")
+    return {"text": read_output_tail(path, int(query.get("max_bytes", 64 * 1024)))}
+
+
+def _shutdown(handler, query, body):
+    threading.Thread(target=handler.server.stop, daemon=True).start()
+    return {"stopping": True}
+
+
+ROUTES = {
+    ("GET", "/status"): lambda handler, query, body: handler.core.status(),
+    ("GET", "/scripts"): lambda handler, query, body: {"scripts": handler.core.list_scripts()},
+    ("POST", "/scripts/add"): _add_script,
+    ("POST", "/scripts/remove"): lambda handler, query, body: handler.core.remove_script(
+        _script_id(handler, body)) or {},
+    ("POST", "/scripts/schedule"): lambda handler, query, body: handler.core.schedule_script(
+        _script_id(handler, body), body.get("time")) or {},
+    ("POST", "/scripts/run"): _run_script,
+    ("POST", "/scripts/pipeline"): _set_pipeline,
+    ("GET", "/pipeline"): lambda handler, query, body: handler.core.pipeline(),
+    ("POST", "/pipeline/rerun-failed"): lambda handler, query, body: {
+        "runs": [run_to_dict(run) for run in handler.core.rerun_failed()]},
+    ("GET", "/jobs"): lambda handler, query, body: {"jobs": handler.core.list_jobs()},
+    ("POST", "/jobs/clear"): lambda handler, query, body: handler.core.clear_jobs() or {},
+    ("POST", "/scheduler/start"): lambda handler, query, body: {"started": handler.core.start_scheduler()},
+    ("GET", "/events"): lambda handler, query, body: {"events": handler.core.events.since(
+        int(query.get("since", 0)), min(float(query.get("timeout", 0)), MAX_EVENT_WAIT))},
+    ("GET", "/runs"): lambda handler, query, body: {"runs": handler.core.history.page(
+        search=query.get("search") or None, status=query.get("status") or None,
+        before=_history_key(query.get("before")), after=_history_key(query.get("after")),
+        limit=int(query.get("limit", 100)))},
+    ("GET", "/output"): _output_tail,
+    ("GET", "/stats"): lambda handler, query, body: handler.core.stats(),
+    ("POST", "/shutdown"): _shutdown,
+}
+
+
+class _ControlServerMixin:
+    daemon_threads = True
+    token = None  # Token requests must carry, or None to accept any client that can connect
+
+    def stop(self):
+        """Stop serving; main() then shuts the core down before the process exits."""
+        self.shutdown()
+
+
+class TCPControlServer(_ControlServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixControlServer(_ControlServerMixin, socketserver.ThreadingUnixStreamServer):
+    bound_inode = None  # Inode of the socket file this server created, so it never removes another daemon's
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.server_address)
+                raise OSError(f"A scheduler daemon is already listening on {self.server_address}")
+            except ConnectionRefusedError:
+                os.unlink(self.server_address)  # Stale socket from a daemon that did not exit cleanly
+            finally:
+                probe.close()
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+        self.bound_inode = os.stat(self.server_address).st_ino
+
+    def server_close(self):
+        super().server_close()
+        try:
+            if self.bound_inode is not None and os.stat(self.server_address).st_ino == self.bound_inode:
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def create_server(core, address=DEFAULT_ADDRESS, token_file=TOKEN_FILE):
+    """Bind the control server. Raises OSError if the address is taken, e.g. by a running daemon.
+
+    TCP servers only bind loopback addresses (ValueError otherwise) and require the token they
+    write to token_file.
+    """
+    kind, bind_address = parse_address(address)
+    if kind == "tcp":
+        _check_loopback(bind_address[0])
+        server = TCPControlServer(bind_address, ControlRequestHandler)
+        try:
+            server.token = _write_token(token_file)
+        except OSError:
+            server.server_close()
+            raise
+    else:
+        server = UnixControlServer(bind_address, ControlRequestHandler)
+    server.core = core
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the script scheduler without a GUI.")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS,
+                        help="Unix socket path, or loopback host:port to listen on TCP (default: %(default)s)")
+    parser.add_argument("--token-file", default=TOKEN_FILE, help="Where to write the API token for TCP clients")
+    parser.add_argument("--paused", action="store_true", help="Don't fire scheduled jobs until told to start")
+    args = parser.parse_args(argv)
+
+    # Bind before touching the registry or the timer, so a second daemon gives up without side effects
+    try:
+        server = create_server(None, args.address, args.token_file)
+    except (OSError, ValueError) as e:
+        print(f"Cannot listen on {args.address}: {e}", file=sys.stderr)
+        return 1
+    try:
+        core = SchedulerCore()
+    except BaseException:
+        server.server_close()
+        raise
+    server.core = core
+    core.restore_jobs()
+    if not args.paused:
+        core.start_scheduler()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.stop, daemon=True).start())
+    print(f"Scheduler daemon {os.getpid()} listening on {args.address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        core.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import heapq
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from output_capture import LOG_DIR, TAIL_LINES, OutputCapture, run_log_path
+from warm_pool import WarmPoolManager
+
+# Overlap policies: what to do when a script is submitted while a run of it is still queued or running
+OVERLAP_SKIP = "skip"
+OVERLAP_QUEUE = "queue"
+
+# Execution modes: start a fresh interpreter per run, or fork from a pre-warmed one (see warm_pool)
+MODE_COLD = "cold"
+MODE_WARM = "warm"
+
+PIPE_DRAIN_TIMEOUT = 5  # Seconds to keep reading output after the process exits
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024  # Bytes per unit of ru_maxrss (KiB except on macOS)
+
+
+class ScriptRun:
+    """A single execution of a script, from submission to completion."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, file_path, priority=0, timeout=None, python="python", mode=MODE_COLD, scheduled_for=None):
+        self.run_id = next(ScriptRun._ids)
+        self.file_path = file_path
+        self.priority = priority  # Lower numbers run first
+        self.timeout = timeout
+        self.python = python
+        self.mode = mode
+        # Seconds the scheduler spent launching the process: fork/exec, or the warm pool's fork. Interpreter
+        # startup happens after that in the child, so compare modes by duration rather than by this.
+        self.launch_latency = None
+        # queued -> running -> finished (exit code 0) / failed (non-zero) / timed out / launch failed / cancelled
+        self.status = "queued"
+        self.returncode = None
+        self.log_path = None  # Full output of the run
+        self.capture = None  # OutputCapture holding the tail of the output
+        self.error = None
+        self.scheduled_for = scheduled_for  # Fire time that triggered the run, None for manual runs
+        self.submitted_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.rusage = None  # {"utime", "stime", "maxrss"} of the process once it has been reaped
+        self.timed_out = False
+        self.kill_lock = threading.Lock()  # Held while reaping a cold run, so a kill never hits a recycled pid
+        self.done = threading.Event()
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    @property
+    def drift(self):
+        """Seconds between the fire time that triggered the run and its actual start."""
+        if self.scheduled_for and self.started_at:
+            return (self.started_at - self.scheduled_for).total_seconds()
+        return None
+
+    @property
+    def cpu_time(self):
+        return self.rusage["utime"] + self.rusage["stime"] if self.rusage else None
+
+    @property
+    def max_rss(self):
+        """Peak resident set size of the process in bytes."""
+        return self.rusage["maxrss"] * MAXRSS_UNIT if self.rusage else None
+
+    @property
+    def stdout(self):
+        return "\n".join(self.capture.tail("stdout")) if self.capture else ""
+
+    @property
+    def stderr(self):
+        return "\n".join(self.capture.tail("stderr")) if self.capture else ""
+
+
+class ExecutionEngine:
+    """Run scripts as subprocesses on a bounded pool of worker threads.
+
+    Runs are dispatched by priority. A script never has more than its concurrency limit of runs in
+    flight; extra runs of the same script wait in a per-script queue without blocking other scripts.
+    """
+
+    def __init__(self, max_workers=None, per_script_limit=1, overlap=OVERLAP_SKIP, default_timeout=None,
+                 python="python", mode=MODE_COLD, warm_pools=None, log_dir=LOG_DIR, tail_lines=TAIL_LINES,
+                 on_start=None, on_output=None, on_complete=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.per_script_limit = per_script_limit
+        self.overlap = overlap
+        self.default_timeout = default_timeout
+        self.python = python
+        self.mode = mode
+        self.warm_pools = warm_pools  # WarmPoolManager, created on first warm run if not given
+        self.log_dir = log_dir
+        self.tail_lines = tail_lines
+        self.on_start = on_start  # Called from a worker thread with the ScriptRun
+        self.on_output = on_output  # Called from a reader thread with (run, stream, text) as output arrives
+        self.on_complete = on_complete  # Called from a worker thread with the ScriptRun
+
+        self._cond = threading.Condition()
+        self._heap = []  # (priority, sequence, run) of runs ready to dispatch
+        self._sequence = itertools.count()
+        self._blocked = {}  # file_path -> deque of runs waiting on the per-script limit
+        self._limits = {}  # file_path -> per-script concurrency override
+        self._pending = {}  # file_path -> number of runs queued or running
+        self._running = {}  # file_path -> number of runs running
+        self._active_runs = set()
+        self._mode_stats = {}  # mode -> [runs, total duration]
+        self._shutdown = False
+
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._worker, name=f"script-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def set_script_limit(self, file_path, limit):
+        """Override the number of concurrent runs allowed for one script."""
+        with self._cond:
+            self._limits[file_path] = limit
+            self._release_blocked(file_path)
+
+    def submit(self, file_path, priority=0, timeout=None, overlap=None, max_concurrency=None, python=None,
+               mode=None, scheduled_for=None):
+        """Queue a run of the script. Returns the ScriptRun, or None if skipped by the overlap policy.
+
+        python pins the interpreter (e.g. a virtualenv's) and mode picks cold or warm execution;
+        both default to the engine's settings.
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Execution engine has been shut down")
+            if max_concurrency is not None:
+                self._limits[file_path] = max_concurrency
+            if (overlap or self.overlap) == OVERLAP_SKIP and self._pending.get(file_path):
+                return None
+            run = ScriptRun(file_path, priority, timeout if timeout is not None else self.default_timeout,
+                            python or self.python, mode or self.mode, scheduled_for)
+            self._pending[file_path] = self._pending.get(file_path, 0) + 1
+            heapq.heappush(self._heap, (priority, next(self._sequence), run))
+            self._cond.notify()
+        return run
+
+    def is_busy(self, file_path):
+        """Return True if the script has a run queued or running."""
+        with self._cond:
+            return bool(self._pending.get(file_path))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "running": sum(self._running.values()),
+                "queued": sum(self._pending.values()) - sum(self._running.values()),
+            }
+
+    def mode_stats(self):
+        """Return the mean run duration per execution mode, to compare cold and warm runs.
+
+        Durations include interpreter startup, which is what warm runs save.
+        """
+        with self._cond:
+            return {mode: {"runs": runs, "mean_duration": duration / runs}
+                    for mode, (runs, duration) in self._mode_stats.items()}
+
+    def shutdown(self, kill=False, wait=True):
+        """Stop accepting runs, drop queued ones and optionally kill the running ones."""
+        with self._cond:
+            self._shutdown = True
+            dropped = [entry[2] for entry in self._heap]
+            for runs in self._blocked.values():
+                dropped.extend(runs)
+            self._heap.clear()
+            self._blocked.clear()
+            running = list(self._active_runs)
+            self._cond.notify_all()
+        for run in dropped:
+            run.status = "cancelled"
+            run.done.set()
+        if kill:
+            for run in running:
+                self._kill(run)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+            if self.warm_pools is not None:
+                self.warm_pools.close()
+
+    def _limit(self, file_path):
+        return self._limits.get(file_path, self.per_script_limit)
+
+    def _release_blocked(self, file_path):
+        """Move runs waiting on the per-script limit back to the dispatch heap. Caller holds the lock."""
+        waiting = self._blocked.get(file_path)
+        free = self._limit(file_path) - self._running.get(file_path, 0)
+        while waiting and free > 0:
+            run = waiting.popleft()
+            heapq.heappush(self._heap, (run.priority, next(self._sequence), run))
+            free -= 1
+            self._cond.notify()
+        if not waiting:
+            self._blocked.pop(file_path, None)
+
+    def _next_run(self):
+        with self._cond:
+            while True:
+                while self._heap:
+                    run = heapq.heappop(self._heap)[2]
+                    if self._running.get(run.file_path, 0) < self._limit(run.file_path):
+                        self._running[run.file_path] = self._running.get(run.file_path, 0) + 1
+                        self._active_runs.add(run)
+                        return run
+                    self._blocked.setdefault(run.file_path, deque()).append(run)
+                if self._shutdown:
+                    return None
+                self._cond.wait()
+
+    def _finish(self, run):
+        with self._cond:
+            self._active_runs.discard(run)
+            if run.process is not None and run.duration is not None:
+                totals = self._mode_stats.setdefault(run.mode, [0, 0.0])
+                totals[0] += 1
+                totals[1] += run.duration
+            for counter in (self._running, self._pending):
+                counter[run.file_path] -= 1
+                if not counter[run.file_path]:
+                    del counter[run.file_path]
+            self._release_blocked(run.file_path)
+
+    def _worker(self):
+        while True:
+            run = self._next_run()
+            if run is None:
+                return
+            try:
+                self._execute(run)
+            finally:
+                self._finish(run)
+                run.done.set()
+            self._notify(self.on_complete, run)
+
+    @staticmethod
+    def _notify(callback, run):
+        """Call an on_start/on_complete callback. An exception in it must not take the worker thread down."""
+        if callback is None:
+            return
+        try:
+            callback(run)
+        except Exception:
+            traceback.print_exc()
+
+    def _execute(self, run):
+        run.status = "running"
+        run.started_at = datetime.now()
+        self._notify(self.on_start, run)
+        try:
+            run.log_path = run_log_path(run.file_path, run.started_at, self.log_dir)
+            on_output = (lambda stream, text: self.on_output(run, stream, text)) if self.on_output else None
+            run.capture = OutputCapture(run.log_path, self.tail_lines, on_output)
+            try:
+                run.process = self._launch(run)
+            except Exception:
+                run.capture.join()
+                raise
+            run.capture.attach(run.process)
+            self._wait(run)
+            # Orphaned grandchildren may keep the pipes open; don't let them hold the worker forever
+            run.capture.join(timeout=PIPE_DRAIN_TIMEOUT)
+            run.returncode = run.process.returncode
+            if run.timed_out:
+                run.status = "timed out"
+            else:
+                run.status = "finished" if run.returncode == 0 else "failed"
+        except Exception as e:
+            run.status = "launch failed"
+            run.error = e
+        run.finished_at = datetime.now()
+
+    def _launch(self, run):
+        launched_at = time.perf_counter()
+        if run.mode == MODE_WARM:
+            with self._cond:
+                if self.warm_pools is None:
+                    self.warm_pools = WarmPoolManager()
+            # The first run of an interpreter waits for its pool to preload; don't count that as launch time
+            self.warm_pools.get(run.python).start()
+            launched_at = time.perf_counter()
+            process = self.warm_pools.launch(run.python, run.file_path)
+        else:
+            process = subprocess.Popen([run.python, run.file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        run.launch_latency = time.perf_counter() - launched_at
+        return process
+
+    def _wait(self, run):
+        """Wait for the run's process to exit, killing it at its timeout, and collect its resource usage."""
+        process = run.process
+        if not isinstance(process, subprocess.Popen) or not hasattr(os, "wait4"):
+            try:
+                process.wait(timeout=run.timeout)
+            except subprocess.TimeoutExpired:
+                self._time_out(run)
+                process.wait()
+            # Warm runs get their rusage from the pool server, which reaps its children with wait4
+            run.rusage = getattr(process, "rusage", None)
+            return
+        # Popen.wait() discards the child's rusage, so reap it with wait4 and time out with a timer instead
+        killer = None
+        if run.timeout is not None:
+            killer = threading.Timer(run.timeout, self._time_out, (run,))
+            killer.daemon = True
+            killer.start()
+        try:
+            if hasattr(os, "waitid"):
+                os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)  # Exited but not reaped, so the pid is ours
+                with run.kill_lock:
+                    _, status, rusage = os.wait4(process.pid, 0)
+                    process.returncode = os.waitstatus_to_exitcode(status)
+            else:
+                # No waitid (macOS before Python 3.13): a timeout landing between the reap and setting the
+                # return code could still signal a recycled pid, but the window is a few instructions wide
+                _, status, rusage = os.wait4(process.pid, 0)
+                with run.kill_lock:
+                    process.returncode = os.waitstatus_to_exitcode(status)
+        finally:
+            if killer is not None:
+                killer.cancel()
+        run.rusage = {"utime": rusage.ru_utime, "stime": rusage.ru_stime, "maxrss": rusage.ru_maxrss}
+
+    def _time_out(self, run):
+        run.timed_out = True
+        self._kill(run)
+
+    @staticmethod
+    def _kill(run):
+        process = run.process
+        if process is None:
+            return
+        with run.kill_lock:
+            if process.returncode is not None:
+                return
+            if isinstance(process, subprocess.Popen) and hasattr(os, "wait4"):
+                os.kill(process.pid, signal.SIGKILL)  # Popen.kill() polls, which would reap it from under wait4
+            else:
+                process.kill()
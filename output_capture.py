@@ -0,0 +1,134 @@
+import codecs
+import os
+import re
+import threading
+from collections import deque
+
+LOG_DIR = "logs"  # Full output of every run is spooled here
+TAIL_LINES = 200  # Lines of output kept in memory per run
+MAX_LINE_LENGTH = 4096  # Longer lines are cut in the in-memory tail (the log file keeps them whole)
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def run_log_path(file_path, started_at, log_dir=LOG_DIR):
+    """Return a unique log file path for a run of the script."""
+    os.makedirs(log_dir, exist_ok=True)
+    base_name = re.sub(r"[^\w.-]", "_", os.path.splitext(os.path.basename(file_path))[0])
+    stamp = started_at.strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(log_dir, f"{base_name}_{stamp}.log")
+
+
+class OutputCapture:
+    """Stream a process's stdout and stderr into a log file, keeping only the last lines in memory.
+
+    One reader thread per pipe copies raw chunks straight to the log file, so memory use does not
+    depend on how much the script prints. Decoded text is handed to on_output(stream, text) as it
+    arrives.
+    """
+
+    def __init__(self, log_path, tail_lines=TAIL_LINES, on_output=None):
+        self.log_path = log_path
+        self.on_output = on_output
+        self.bytes_written = 0
+        self._tail = deque(maxlen=tail_lines)  # (stream, line)
+        self._lock = threading.Lock()
+        self._log_file = open(log_path, "wb")
+        self._readers = []
+
+    def attach(self, process):
+        """Start reading the process's stdout and stderr pipes."""
+        for stream, pipe in (("stdout", process.stdout), ("stderr", process.stderr)):
+            if pipe is None:
+                continue
+            reader = threading.Thread(target=self._read, args=(stream, pipe), daemon=True)
+            reader.start()
+            self._readers.append(reader)
+
+    def join(self, timeout=None):
+        """Wait for both pipes to reach end of file, then close the log file."""
+        for reader in self._readers:
+            reader.join(timeout)
+        with self._lock:
+            if not self._log_file.closed:
+                self._log_file.close()
+
+    def tail(self, stream=None):
+        """Return the last captured lines, optionally only those of one stream."""
+        with self._lock:
+            return [line for source, line in self._tail if stream is None or source == stream]
+
+    def _read(self, stream, pipe):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        partial = ""
+        fd = pipe.fileno()
+        try:
+            while True:
+                chunk = os.read(fd, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                lines = (partial + text).split("\n")
+                partial = lines.pop()[-MAX_LINE_LENGTH:]
+                with self._lock:
+                    if not self._log_file.closed:
+                        self._log_file.write(chunk)
+                        self.bytes_written += len(chunk)
+                    self._tail.extend((stream, line[:MAX_LINE_LENGTH]) for line in lines)
+                if self.on_output and text:
+                    self.on_output(stream, text)
+            text = decoder.decode(b"", final=True)
+            partial += text
+            if partial:
+                with self._lock:
+                    self._tail.append((stream, partial[:MAX_LINE_LENGTH]))
+                if self.on_output and text:
+                    self.on_output(stream, text)
+        finally:
+            pipe.close()
+
+
+class OutputBatcher:
+    """Thread-safe buffer that coalesces output chunks from many runs for the UI.
+
+    Writers add chunks from reader threads; the UI drains everything pending in one go. When the
+    UI falls behind, the oldest chunks are dropped so the buffer never holds more than max_chars.
+    """
+
+    def __init__(self, max_chars=256 * 1024):
+        self.max_chars = max_chars
+        self._chunks = deque()  # (key, stream, text)
+        self._size = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self.pending = threading.Event()  # Set while chunks are waiting to be drained
+
+    def add(self, key, stream, text):
+        with self._lock:
+            self.pending.set()
+            if self._chunks and self._chunks[-1][0] == key and self._chunks[-1][1] == stream:
+                self._chunks[-1] = (key, stream, self._chunks[-1][2] + text)
+            else:
+                self._chunks.append((key, stream, text))
+            self._size += len(text)
+            while self._size > self.max_chars and self._chunks:
+                old_key, old_stream, old_text = self._chunks.popleft()
+                excess = self._size - self.max_chars
+                if len(old_text) > excess:
+                    # Keep the newest part of the chunk
+                    self._chunks.appendleft((old_key, old_stream, old_text[excess:]))
+                    self._size -= excess
+                    self._dropped += excess
+                else:
+                    self._size -= len(old_text)
+                    self._dropped += len(old_text)
+
+    def drain(self):
+        """Return (chunks, dropped_chars) pending since the last drain."""
+        with self._lock:
+            chunks = list(self._chunks)
+            dropped = self._dropped
+            self._chunks.clear()
+            self._size = 0
+            self._dropped = 0
+            self.pending.clear()
+        return chunks, dropped
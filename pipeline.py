@@ -0,0 +1,106 @@
+"""Dependencies between registered scripts, and content hashes for skipping unchanged pipeline steps.
+
+A script depends on the scripts listed in its "depends_on" entry, and on whichever script declares
+one of its "inputs" among its "outputs".
+"""
+import hashlib
+import os
+import threading
+from collections import deque
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class PipelineGraph:
+    """Upstream/downstream links between scripts, built from their registry entries.
+
+    Raises ValueError if the dependencies form a cycle.
+    """
+
+    def __init__(self, scripts):
+        scripts = list(scripts)
+        self.upstream = {script["id"]: set() for script in scripts}
+        self.downstream = {script["id"]: set() for script in scripts}
+        producers = {}  # Normalized output path -> id of the script that writes it
+        for script in scripts:
+            for output in script.get("outputs") or ():
+                producers[_normalize(output)] = script["id"]
+        for script in scripts:
+            upstream = {script_id for script_id in script.get("depends_on") or () if script_id in self.upstream}
+            for input_path in script.get("inputs") or ():
+                producer = producers.get(_normalize(input_path))
+                if producer is not None:
+                    upstream.add(producer)
+            upstream.discard(script["id"])
+            self.upstream[script["id"]] = upstream
+            for parent in upstream:
+                self.downstream[parent].add(script["id"])
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        remaining = {script_id: len(upstream) for script_id, upstream in self.upstream.items()}
+        ready = deque(script_id for script_id, count in remaining.items() if not count)
+        order = []
+        while ready:
+            script_id = ready.popleft()
+            order.append(script_id)
+            for child in self.downstream[script_id]:
+                remaining[child] -= 1
+                if not remaining[child]:
+                    ready.append(child)
+        if len(order) < len(remaining):
+            cyclic = sorted(script_id for script_id, count in remaining.items() if count)
+            raise ValueError(f"Pipeline dependencies form a cycle through: {', '.join(cyclic)}")
+        return order
+
+    def descendants(self, script_id):
+        """Return every script downstream of this one, directly or not."""
+        found = set()
+        pending = [script_id]
+        while pending:
+            for child in self.downstream.get(pending.pop(), ()):
+                if child not in found:
+                    found.add(child)
+                    pending.append(child)
+        return found
+
+
+class StepHasher:
+    """Content hashes of pipeline steps: the script, its interpreter and its input files.
+
+    File digests are cached by (mtime_ns, size), so inputs that have not changed are not read again.
+    """
+
+    def __init__(self):
+        self._files = {}  # Normalized path -> (mtime_ns, size, digest)
+        self._lock = threading.Lock()
+
+    def file_digest(self, path):
+        """Return the SHA-256 of the file, or None if it does not exist."""
+        key = _normalize(path)
+        try:
+            stat = os.stat(key)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._files.get(key)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(key, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        with self._lock:
+            self._files[key] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def step_hash(self, script):
+        digest = hashlib.sha256()
+        digest.update(f"{script.get('python') or ''}\0{self.file_digest(script['file_path'])}".encode())
+        for input_path in sorted(script.get("inputs") or ()):
+            digest.update(f"\0{input_path}\0{self.file_digest(input_path)}".encode())
+        return digest.hexdigest()
@@ -0,0 +1,245 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from output_capture import LOG_DIR
+
+HISTORY_DB_FILE = "run_history.db"
+RETENTION_DAYS = 365  # Runs older than this are deleted by prune()
+OUTPUT_RETENTION_DAYS = 30  # Run output files older than this are deleted by prune(); their rows are kept
+BATCH_SIZE = 500  # Maximum rows written per transaction
+FLUSH_INTERVAL = 0.5  # Seconds the writer waits to fill a batch
+PRUNE_INTERVAL = 24 * 3600  # Seconds between automatic prunes by the writer thread
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    script TEXT NOT NULL,
+    scheduled_at REAL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    exit_code INTEGER,
+    status TEXT NOT NULL,
+    duration REAL,
+    mode TEXT,
+    output_path TEXT,
+    cpu_user REAL,
+    cpu_system REAL,
+    max_rss INTEGER,
+    drift REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started_at, id);
+CREATE INDEX IF NOT EXISTS idx_runs_script_started ON runs (script, started_at, id);
+CREATE INDEX IF NOT EXISTS idx_runs_status_started ON runs (status, started_at, id);
+"""
+
+COLUMNS = ("id", "script", "scheduled_at", "started_at", "finished_at", "exit_code", "status", "duration", "mode",
+           "output_path", "cpu_user", "cpu_system", "max_rss", "drift")
+# Columns added after the first release, with their types, for upgrading existing databases
+ADDED_COLUMNS = {"cpu_user": "REAL", "cpu_system": "REAL", "max_rss": "INTEGER", "drift": "REAL"}
+# Schema upgrades by PRAGMA user_version: version 1 gave non-zero exits their own "failed" status,
+# which launch failures had until then
+STATUS_UPGRADE = """
+UPDATE runs SET status = 'launch failed' WHERE status = 'failed';
+UPDATE runs SET status = 'failed' WHERE status = 'finished' AND exit_code != 0;
+PRAGMA user_version = 1;
+"""
+INSERT_RUN = f"INSERT INTO runs ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * len(COLUMNS[1:]))})"
+
+
+def _timestamp(moment):
+    return moment.timestamp() if moment is not None else None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # Already gone, or not ours to delete
+
+
+class RunHistory:
+    """Persistent run history in SQLite, one row per run.
+
+    record() may be called from any thread: rows are queued and a single writer thread inserts them
+    in batches. Readers get their own connection per thread, and WAL mode lets them query while the
+    writer commits.
+    """
+
+    def __init__(self, path=HISTORY_DB_FILE, retention_days=RETENTION_DAYS, output_retention_days=OUTPUT_RETENTION_DAYS,
+                 log_dir=LOG_DIR):
+        self.path = path
+        self.retention_days = retention_days
+        self.output_retention_days = output_retention_days
+        self.log_dir = log_dir
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+
+        connection = self._connect()
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Only takes effect on a new database
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(SCHEMA)
+        existing = {row[1] for row in connection.execute("PRAGMA table_info(runs)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                connection.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+        connection.commit()
+        if connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            connection.executescript(STATUS_UPGRADE)
+
+        self._writer = threading.Thread(target=self._write_loop, name="run-history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, and far fewer fsyncs
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def record(self, script, started_at, status, scheduled_at=None, finished_at=None, exit_code=None, mode=None,
+               output_path=None, cpu_user=None, cpu_system=None, max_rss=None, drift=None):
+        """Queue a run for insertion. Times are datetimes, max_rss is in bytes."""
+        duration = (finished_at - started_at).total_seconds() if finished_at is not None else None
+        self._queue.put((script, _timestamp(scheduled_at), _timestamp(started_at), _timestamp(finished_at),
+                         exit_code, status, duration, mode, output_path, cpu_user, cpu_system, max_rss, drift))
+
+    def record_run(self, run):
+        """Queue a finished ScriptRun for insertion."""
+        rusage = run.rusage or {}
+        self.record(run.file_path, run.started_at or run.submitted_at, run.status,
+                    scheduled_at=run.scheduled_for, finished_at=run.finished_at, exit_code=run.returncode,
+                    mode=run.mode, output_path=run.log_path, cpu_user=rusage.get("utime"),
+                    cpu_system=rusage.get("stime"), max_rss=run.max_rss, drift=run.drift)
+
+    def flush(self):
+        """Block until every queued row has been written."""
+        self._queue.join()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self):
+        connection = self._connect()
+        last_prune = 0
+        while True:
+            rows = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while rows[-1] is not None and len(rows) < BATCH_SIZE:
+                try:
+                    rows.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = rows[-1] is None
+            batch = [row for row in rows if row is not None]
+            try:
+                if batch:
+                    with connection:
+                        connection.executemany(INSERT_RUN, batch)
+                if time.time() - last_prune > PRUNE_INTERVAL:
+                    last_prune = time.time()
+                    self._prune(connection)
+            except (sqlite3.Error, OSError):
+                pass  # Losing a batch of history or a prune must not take the writer thread down
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    def prune(self, retention_days=None, output_retention_days=None):
+        """Delete runs older than the retention period and give the space back. Returns rows deleted.
+
+        Output files go sooner, after the output retention period: those of older runs are deleted and
+        their rows forget them, and so is anything else in the log directory that has not been written
+        to since.
+        """
+        return self._prune(self._reader(), retention_days, output_retention_days)
+
+    def _prune(self, connection, retention_days=None, output_retention_days=None):
+        retention_days = self.retention_days if retention_days is None else retention_days
+        output_retention_days = self.output_retention_days if output_retention_days is None else output_retention_days
+        cutoff = time.time() - retention_days * 86400
+        output_cutoff = max(cutoff, time.time() - output_retention_days * 86400)
+        with connection:
+            expired = [row[0] for row in connection.execute(
+                "SELECT output_path FROM runs WHERE started_at < ? AND output_path IS NOT NULL", (output_cutoff,))]
+            connection.execute("UPDATE runs SET output_path = NULL WHERE started_at < ? AND output_path IS NOT NULL",
+                               (output_cutoff,))
+            deleted = connection.execute("DELETE FROM runs WHERE started_at < ?", (cutoff,)).rowcount
+        for output_path in expired:
+            _remove(output_path)
+        if self.log_dir and os.path.isdir(self.log_dir):
+            # Also catches files whose rows were lost or pruned before their output was
+            for entry in os.scandir(self.log_dir):
+                if entry.name.endswith(".log") and entry.is_file() and entry.stat().st_mtime < output_cutoff:
+                    _remove(entry.path)
+        if deleted:
+            connection.executescript("PRAGMA incremental_vacuum;")  # execute() would only free one page
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.execute("PRAGMA optimize")
+        return deleted
+
+    def page(self, script=None, status=None, search=None, before=None, after=None, limit=100):
+        """Return one page of runs, newest first, as dicts.
+
+        Pages are addressed by keyset rather than offset: pass the (started_at, id) of the last row of
+        the current page as `before` for the next page, or of the first row as `after` for the previous
+        one. Either way only the rows of the requested page are read, using the indexes.
+        """
+        clauses, params = [], []
+        if script:
+            clauses.append("script = ?")
+            params.append(script)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if search:
+            clauses.append("script LIKE ?")
+            params.append(f"%{search}%")
+        order = "DESC"
+        if before is not None:
+            clauses.append("(started_at, id) < (?, ?)")
+            params.extend(before)
+        elif after is not None:
+            clauses.append("(started_at, id) > (?, ?)")
+            params.extend(after)
+            order = "ASC"
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM runs {where} ORDER BY started_at {order}, id {order} LIMIT ?",
+            params + [limit]).fetchall()
+        if order == "ASC":
+            rows.reverse()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def runs_since(self, since):
+        """Yield every run started at or after the `since` timestamp, oldest first, as dicts."""
+        cursor = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM runs WHERE started_at >= ? ORDER BY started_at, id", (since,))
+        for row in cursor:
+            yield dict(zip(COLUMNS, row))
+
+    def scripts(self):
+        """Return every script that has history, for filtering."""
+        return [row[0] for row in self._reader().execute("SELECT DISTINCT script FROM runs ORDER BY script")]
+
+
+def read_output_tail(output_path, max_bytes=64 * 1024):
+    """Return the last max_bytes of a run's output file."""
+    if not output_path or not os.path.exists(output_path):
+        return ""
+    with open(output_path, "rb") as file:
+        file.seek(max(0, os.path.getsize(output_path) - max_bytes))
+        return file.read().decode("utf-8", errors="replace")
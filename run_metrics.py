@@ -0,0 +1,249 @@
+"""Per-script run metrics: wall time, CPU time and schedule drift histograms, peak memory and alerts.
+
+Metrics are kept in memory and can be rendered in the Prometheus text exposition format, e.g. for
+node_exporter's textfile collector (see write_textfile).
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)  # Seconds, for wall and CPU time
+DRIFT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300)  # Seconds late a scheduled run started
+# Alert thresholds; a script can override them with "slow_run_seconds" and "memory_growth_factor" entries
+SLOW_RUN_SECONDS = 600  # Runs taking longer raise a slow-run alert, None to disable
+MEMORY_GROWTH_FACTOR = 1.5  # Alert when peak RSS exceeds this multiple of the recent average, None to disable
+MEMORY_BASELINE_RUNS = 10  # Recent runs averaged for the memory baseline
+MEMORY_BASELINE_MIN_RUNS = 3  # Runs needed before memory growth is judged
+MAX_ALERTS = 200  # Recent alerts kept for clients
+METRIC_PREFIX = "script_scheduler"
+
+ALERT_SLOW_RUN = "slow_run"
+ALERT_MEMORY_GROWTH = "memory_growth"
+
+
+class Histogram:
+    """Fixed-bucket histogram, cumulative in the Prometheus sense when exported."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating within its bucket, as Prometheus' histogram_quantile does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.max  # Beyond the last bucket the best we know is the largest value
+                lower = self.buckets[index - 1] if index else 0.0
+                return min(lower + (self.buckets[index] - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def prometheus_lines(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound is None else repr(float(bound))
+            lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum!r}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+class ScriptMetrics:
+    def __init__(self):
+        self.runs = {}  # status -> count
+        self.failures = 0  # Runs that exited non-zero, timed out or failed to launch
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.cpu = Histogram(DURATION_BUCKETS)
+        self.drift = Histogram(DRIFT_BUCKETS)
+        self.recent_rss = deque(maxlen=MEMORY_BASELINE_RUNS)
+        self.last_rss = None
+        self.peak_rss = None
+        self.alerts = {}  # alert kind -> count
+        self.last_run = None  # Timestamp the last run finished
+
+    def rss_baseline(self):
+        if len(self.recent_rss) < MEMORY_BASELINE_MIN_RUNS:
+            return None
+        return sum(self.recent_rss) / len(self.recent_rss)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    pairs = list(labels.items()) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class RunMetrics:
+    """Aggregates finished runs per script and raises slow-run and memory-growth alerts. Thread-safe."""
+
+    def __init__(self, slow_run_seconds=SLOW_RUN_SECONDS, memory_growth_factor=MEMORY_GROWTH_FACTOR,
+                 max_alerts=MAX_ALERTS):
+        self.slow_run_seconds = slow_run_seconds
+        self.memory_growth_factor = memory_growth_factor
+        self._scripts = {}  # file_path -> ScriptMetrics
+        self._alerts = deque(maxlen=max_alerts)
+        self._lock = threading.Lock()
+        self.version = 0  # Bumped on every change, so exporters can skip unchanged writes
+
+    def observe(self, script, status, exit_code=None, duration=None, cpu_time=None, max_rss=None, drift=None,
+                run_id=None, finished_at=None, slow_run_seconds=None, memory_growth_factor=None, alert=True):
+        """Add a run to the script's metrics. Returns the alerts it raised, as dicts.
+
+        The thresholds default to the instance's; pass a script's own to override them. Runs replayed
+        from history are observed with alert=False.
+        """
+        slow_run_seconds = self.slow_run_seconds if slow_run_seconds is None else slow_run_seconds
+        memory_growth_factor = self.memory_growth_factor if memory_growth_factor is None else memory_growth_factor
+        alerts = []
+        with self._lock:
+            metrics = self._scripts.get(script)
+            if metrics is None:
+                metrics = self._scripts[script] = ScriptMetrics()
+            metrics.runs[status] = metrics.runs.get(status, 0) + 1
+            if status in ("failed", "timed out", "launch failed") or exit_code:
+                metrics.failures += 1
+            metrics.last_run = finished_at or time.time()
+            if duration is not None:
+                metrics.duration.observe(duration)
+                if slow_run_seconds is not None and duration > slow_run_seconds:
+                    alerts.append((ALERT_SLOW_RUN, duration, slow_run_seconds,
+                                   f"ran for {duration:.1f} s, over the {slow_run_seconds} s threshold"))
+            if cpu_time is not None:
+                metrics.cpu.observe(cpu_time)
+            if drift is not None:
+                metrics.drift.observe(max(drift, 0.0))
+            if max_rss is not None:
+                baseline = metrics.rss_baseline()
+                if baseline and memory_growth_factor is not None and max_rss > baseline * memory_growth_factor:
+                    alerts.append((ALERT_MEMORY_GROWTH, max_rss, baseline * memory_growth_factor,
+                                   f"peak memory {max_rss / 2 ** 20:.1f} MiB, {max_rss / baseline:.1f}x its recent "
+                                   f"average of {baseline / 2 ** 20:.1f} MiB"))
+                metrics.recent_rss.append(max_rss)
+                metrics.last_rss = max_rss
+                metrics.peak_rss = max_rss if metrics.peak_rss is None else max(metrics.peak_rss, max_rss)
+            raised = []
+            if alert:
+                for kind, value, threshold, message in alerts:
+                    metrics.alerts[kind] = metrics.alerts.get(kind, 0) + 1
+                    raised.append({"alert": kind, "script": script, "run_id": run_id, "value": value,
+                                   "threshold": threshold, "message": message,
+                                   "time": datetime.now().isoformat(timespec="seconds")})
+                self._alerts.extend(raised)
+            self.version += 1
+        return raised
+
+    def observe_history(self, rows):
+        """Replay runs from RunHistory rows (e.g. runs_since) without raising alerts."""
+        for row in rows:
+            cpu_time = row["cpu_user"] + row["cpu_system"] if row["cpu_user"] is not None else None
+            self.observe(row["script"], row["status"], row["exit_code"], row["duration"], cpu_time, row["max_rss"],
+                         row["drift"], finished_at=row["finished_at"], alert=False)
+
+    def alerts(self):
+        with self._lock:
+            return list(self._alerts)
+
+    def summary(self):
+        """Return per-script statistics as dicts, for display."""
+        with self._lock:
+            return [{
+                "script": script,
+                "runs": sum(metrics.runs.values()),
+                "failed": metrics.failures,
+                "skipped": metrics.runs.get("skipped", 0),
+                "mean_duration": metrics.duration.mean,
+                "p50_duration": metrics.duration.quantile(0.5),
+                "p95_duration": metrics.duration.quantile(0.95),
+                "max_duration": metrics.duration.max,
+                "cpu_total": metrics.cpu.sum,
+                "mean_cpu": metrics.cpu.mean,
+                "last_rss": metrics.last_rss,
+                "peak_rss": metrics.peak_rss,
+                "mean_drift": metrics.drift.mean,
+                "p95_drift": metrics.drift.quantile(0.95),
+                "max_drift": metrics.drift.max,
+                "alerts": sum(metrics.alerts.values()),
+                "last_run": metrics.last_run,
+            } for script, metrics in self._scripts.items()]
+
+    def prometheus(self, gauges=None):
+        """Render the metrics in the Prometheus text format. `gauges` adds unlabelled gauges by name suffix."""
+        p = METRIC_PREFIX
+        sections = {
+            "runs_total": ("counter", "Finished runs by status", []),
+            "run_failures_total": ("counter", "Runs that failed to start, timed out or exited non-zero", []),
+            "run_duration_seconds": ("histogram", "Wall time of runs", []),
+            "run_cpu_seconds": ("histogram", "User plus system CPU time of runs", []),
+            "schedule_drift_seconds": ("histogram", "Delay between a scheduled run's fire time and its start", []),
+            "run_max_rss_bytes": ("gauge", "Peak resident set size of the script's last run", []),
+            "alerts_total": ("counter", "Alerts raised by kind", []),
+            "last_run_timestamp_seconds": ("gauge", "When the script's last run finished", []),
+        }
+        with self._lock:
+            for script, metrics in sorted(self._scripts.items()):
+                labels = {"script": script}
+                for status, count in sorted(metrics.runs.items()):
+                    sections["runs_total"][2].append(f"{p}_runs_total{_labels(labels, status=status)} {count}")
+                sections["run_failures_total"][2].append(f"{p}_run_failures_total{_labels(labels)} {metrics.failures}")
+                sections["run_duration_seconds"][2].extend(
+                    metrics.duration.prometheus_lines(f"{p}_run_duration_seconds", labels))
+                sections["run_cpu_seconds"][2].extend(metrics.cpu.prometheus_lines(f"{p}_run_cpu_seconds", labels))
+                if metrics.drift.count:
+                    sections["schedule_drift_seconds"][2].extend(
+                        metrics.drift.prometheus_lines(f"{p}_schedule_drift_seconds", labels))
+                if metrics.last_rss is not None:
+                    sections["run_max_rss_bytes"][2].append(
+                        f"{p}_run_max_rss_bytes{_labels(labels)} {metrics.last_rss}")
+                for kind, count in sorted(metrics.alerts.items()):
+                    sections["alerts_total"][2].append(f"{p}_alerts_total{_labels(labels, alert=kind)} {count}")
+                sections["last_run_timestamp_seconds"][2].append(
+                    f"{p}_last_run_timestamp_seconds{_labels(labels)} {metrics.last_run!r}")
+        lines = []
+        for name, (metric_type, help_text, samples) in sections.items():
+            lines.extend([f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} {metric_type}"] + samples)
+        for name, value in (gauges or {}).items():
+            lines.extend([f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path, gauges=None):
+        """Write prometheus() to `path` atomically, so a collector never reads a partial file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".metrics-", suffix=".prom", dir=directory)
+        try:
+            os.chmod(temp_path, 0o644)  # Collectors usually run as another user
+            with os.fdopen(fd, "w") as file:
+                file.write(self.prometheus(gauges))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
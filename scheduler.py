@@ -3,34 +3,56 @@ from tkinter import filedialog, messagebox, simpledialog, Toplevel, scrolledtext
 from tkinter import ttk
 from datetime import datetime
 import os
-import json
-import schedule
-import time
+import queue
 import threading
-import subprocess
+import time
 
-SCRIPT_STORAGE_FILE = "scripts.json"
+from daemon import DEFAULT_ADDRESS
+from scheduler_client import DaemonError, SchedulerClient
+
+DAEMON_ADDRESS = DEFAULT_ADDRESS  # Unix socket path or host:port of the scheduler daemon
+UI_POLL_INTERVAL_MS = 100
+EVENT_POLL_TIMEOUT = 25  # Seconds each long-poll for daemon events may wait
+RECONNECT_DELAY = 2  # Seconds between attempts to reach the daemon after losing it
+MAX_OUTPUT_PANEL_LINES = 2000  # Older lines are trimmed from the output panel; full output is in the run's log file
+HISTORY_PAGE_SIZE = 100  # Runs shown per page in the logs window
+STATS_REFRESH_MS = 5000  # How often the stats window refreshes while open
 
 
 class PythonScriptScheduler:
-    def __init__(self, root):
+    """GUI client of the scheduler daemon. Scheduling and execution happen in the daemon, which keeps
+    running when the window is closed."""
+
+    def __init__(self, root, client):
         self.root = root
         self.root.title("Python Script Scheduler")
         self.root.geometry("900x700")
 
-        self.scripts = []  # List of script dictionaries with file path and time
-        self.logs = []  # List of logs for executed scripts
-        self.jobs = []  # List of jobs with details
+        self.client = client
+        self.scripts = {}  # Script dictionaries by id; the id is also the script's Treeview item id
+        self.script_ids = {}  # file_path -> script id
+        self.jobs = {}  # Scheduled jobs by id (the id of their script)
+        self.script_list_tree = None
+        self.running = {}  # file_path -> number of runs in progress
 
-        # Load saved scripts from storage
+        # The event thread hands daemon events to the Tk main thread through this queue
+        self.ui_events = queue.Queue()
+        self.output_source = None  # (run_id, stream) whose output was last written to the panel
+
+        # Load saved scripts from the daemon
         self.load_scripts()
 
         # GUI Components
-        self.script_list_tree = ttk.Treeview(self.root, columns=("File Name", "Time"), show="headings", height=10)
+        self.script_list_tree = ttk.Treeview(self.root, columns=("File Name", "Time", "After", "Last Run"),
+                                             show="headings", height=10)
         self.script_list_tree.heading("File Name", text="File Name")
         self.script_list_tree.heading("Time", text="Time")
+        self.script_list_tree.heading("After", text="Runs After")
+        self.script_list_tree.heading("Last Run", text="Last Run")
         self.script_list_tree.column("File Name", width=300)
         self.script_list_tree.column("Time", width=100)
+        self.script_list_tree.column("After", width=250)
+        self.script_list_tree.column("Last Run", width=80)
         self.script_list_tree.pack(pady=10)
         self.update_script_tree()  # Populate the Treeview with saved scripts
 
@@ -46,6 +68,13 @@ class PythonScriptScheduler:
         self.run_now_button = tk.Button(self.root, text="Run Selected Now", command=self.run_now)
         self.run_now_button.pack(pady=5)
 
+        self.set_dependencies_button = tk.Button(self.root, text="Set Dependencies",
+                                                 command=self.set_dependencies)
+        self.set_dependencies_button.pack(pady=5)
+
+        self.rerun_failed_button = tk.Button(self.root, text="Rerun Failed", command=self.rerun_failed)
+        self.rerun_failed_button.pack(pady=5)
+
         self.start_scheduler_button = tk.Button(self.root, text="Start Scheduler", command=self.start_scheduler)
         self.start_scheduler_button.pack(pady=10)
 
@@ -81,152 +110,476 @@ class PythonScriptScheduler:
         self.show_logs_button = tk.Button(self.root, text="Show Logs", command=self.show_logs)
         self.show_logs_button.pack(pady=5)
 
+        self.show_stats_button = tk.Button(self.root, text="Show Stats", command=self.show_stats)
+        self.show_stats_button.pack(pady=5)
+
         self.about_button = tk.Button(self.root, text="About", command=self.show_about)
         self.about_button.pack(pady=5)
 
+        self.update_jobs_tree()
+
+        self.root.after(UI_POLL_INTERVAL_MS, self.process_ui_events)
+        threading.Thread(target=self.poll_daemon_events, daemon=True).start()
+
+    def call_daemon(self, method, *args):
+        """Call the daemon from the Tk thread, reporting failures. Returns None on error."""
+        try:
+            return method(*args)
+        except DaemonError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+
     def load_scripts(self):
-        """Load saved scripts from the storage file."""
-        if os.path.exists(SCRIPT_STORAGE_FILE):
-            with open(SCRIPT_STORAGE_FILE, "r") as file:
-                self.scripts = json.load(file)
-
-    def save_scripts(self):
-        """Save the current list of scripts to the storage file."""
-        with open(SCRIPT_STORAGE_FILE, "w") as file:
-            json.dump(self.scripts, file)
-
-    def update_script_tree(self):
-        """Update the Treeview with the current scripts and their predefined times."""
-        self.script_list_tree.delete(*self.script_list_tree.get_children())
-        for script in self.scripts:
+        """Load the registered scripts from the daemon and apply the differences to the tree."""
+        scripts = self.call_daemon(self.client.list_scripts)
+        if scripts is None:
+            return
+        loaded = {script["id"]: script for script in scripts}
+        removed = [script_id for script_id in self.scripts if script_id not in loaded]
+        changed = [script for script_id, script in loaded.items() if self.scripts.get(script_id) != script]
+        self.apply_script_changes(changed, removed)
+
+    def apply_script_changes(self, changed, removed):
+        for script_id in removed:
+            script = self.scripts.pop(script_id, None)
+            if script is not None:
+                self.script_ids.pop(script["file_path"], None)
+        for script in changed:
+            self.scripts[script["id"]] = script
+            self.script_ids[script["file_path"]] = script["id"]
+        if self.script_list_tree is not None:
+            self.update_script_tree(changed, removed)
+
+    def update_script_tree(self, changed=None, removed=()):
+        """Update the Treeview rows of the changed and removed scripts (all of them by default)."""
+        for script_id in removed:
+            if self.script_list_tree.exists(script_id):
+                self.script_list_tree.delete(script_id)
+        for script in self.scripts.values() if changed is None else changed:
             file_name = os.path.basename(script["file_path"])
             time_display = script["time"] if script["time"] else "Not Scheduled"
-            self.script_list_tree.insert("", tk.END, values=(file_name, time_display))
+            after = ", ".join(os.path.basename(self.scripts[script_id]["file_path"])
+                              for script_id in script.get("depends_on") or () if script_id in self.scripts)
+            values = (file_name, time_display, after, script.get("last_status") or "")
+            if self.script_list_tree.exists(script["id"]):
+                self.script_list_tree.item(script["id"], values=values)
+            else:
+                self.script_list_tree.insert("", tk.END, iid=script["id"], values=values)
+
+    def update_jobs_tree(self, changed=None, removed=()):
+        """Update the scheduled jobs Treeview rows of the changed and removed jobs, or reload them all."""
+        if changed is None:
+            jobs = self.call_daemon(self.client.list_jobs)
+            if jobs is None:
+                return
+            removed = [job_id for job_id in self.jobs if job_id not in {job["id"] for job in jobs}]
+            changed = jobs
+        for job_id in removed:
+            self.jobs.pop(job_id, None)
+            if self.scheduled_jobs_tree.exists(job_id):
+                self.scheduled_jobs_tree.delete(job_id)
+        for job in changed:
+            self.jobs[job["id"]] = job
+            file_name = os.path.basename(job["file_path"] or "")
+            values = (file_name, job["time"], job["file_path"])
+            tags = ("running",) if self.running.get(job["file_path"]) else ()
+            if self.scheduled_jobs_tree.exists(job["id"]):
+                self.scheduled_jobs_tree.item(job["id"], values=values, tags=tags)
+            else:
+                self.scheduled_jobs_tree.insert("", tk.END, iid=job["id"], values=values, tags=tags)
 
     def add_script(self):
         file_path = filedialog.askopenfilename(filetypes=[("Python Files", "*.py")])
-        if file_path and not any(script["file_path"] == file_path for script in self.scripts):
-            self.scripts.append({"file_path": file_path, "time": None})  # Default no time
-            self.save_scripts()
-            self.update_script_tree()
+        if file_path and file_path not in self.script_ids:
+            self.call_daemon(self.client.add_script, file_path)  # Default no time
 
     def remove_script(self):
         selected = self.script_list_tree.selection()
         if selected:
-            for item in selected:
-                file_name = self.script_list_tree.item(item, "values")[0]
-                self.scripts = [s for s in self.scripts if os.path.basename(s["file_path"]) != file_name]
-            self.save_scripts()
-            self.update_script_tree()
+            for script_id in selected:
+                self.call_daemon(self.client.remove_script, script_id)
         else:
             messagebox.showwarning("Warning", "No script selected")
 
     def schedule_script(self):
         selected = self.script_list_tree.selection()
         if selected:
-            for item in selected:
-                script = self.scripts[self.script_list_tree.index(item)]
+            for script_id in selected:
+                script = self.scripts[script_id]
                 # Check if the script already has a predefined time
                 if script["time"]:
                     time_input = script["time"]  # Use the predefined time
                 else:
                     # Prompt the user to provide a schedule time
-                    time_input = simpledialog.askstring("Schedule Time", "Enter time (HH:MM 24-hour format):")
+                    time_input = simpledialog.askstring(
+                        "Schedule Time",
+                        "Enter time (HH:MM 24-hour format), 'every 15m', a cron expression or 'YYYY-MM-DD HH:MM':")
                     if not time_input:
                         return  # Cancel scheduling if no time is provided
-                    try:
-                        hour, minute = map(int, time_input.split(":"))
-                        script["time"] = time_input  # Save the new schedule time
-                        self.save_scripts()
-                    except ValueError:
-                        messagebox.showerror("Error", "Invalid time format")
-                        return
-                self.schedule_job(script)  # Schedule the job
+                try:
+                    self.client.schedule_script(script_id, time_input)
+                except DaemonError as e:
+                    messagebox.showerror("Error", f"Invalid time: {e}")
+                    return
                 messagebox.showinfo("Success", f"Scheduled {os.path.basename(script['file_path'])} at {time_input}")
-                self.update_script_tree()
         else:
             messagebox.showwarning("Warning", "No script selected")
 
-    def schedule_job(self, script):
-        """Schedule a job for a specific script."""
-        schedule.every().day.at(script["time"]).do(self.run_script_with_output, script["file_path"])
-        file_name = os.path.basename(script["file_path"])
-        tree_id = self.scheduled_jobs_tree.insert("", tk.END, values=(file_name, script["time"], script["file_path"]))
-        self.jobs.append(
-            {"tree_id": tree_id, "file_name": file_name, "time": script["time"], "location": script["file_path"]})
-
     def run_now(self):
         """Run the selected script immediately."""
         selected = self.script_list_tree.selection()
         if selected:
-            for item in selected:
-                file_name = self.script_list_tree.item(item, "values")[0]
-                script = next(s for s in self.scripts if os.path.basename(s["file_path"]) == file_name)
-                self.run_script_with_output(script["file_path"])
+            for script_id in selected:
+                self.call_daemon(self.client.run_script, script_id)
         else:
             messagebox.showwarning("Warning", "No script selected")
 
-    def run_script_with_output(self, file_path):
-        for job in self.jobs:
-            if job["location"] == file_path:
-                self.scheduled_jobs_tree.item(job["tree_id"], tags=("running",))
-                break
-        self.run_script(file_path, capture_output=True)
-
-    def run_script(self, file_path, capture_output=False):
+    def set_dependencies(self):
+        """Set the scripts the selected script runs after, by file name."""
+        selected = self.script_list_tree.selection()
+        if len(selected) != 1:
+            messagebox.showwarning("Warning", "Select one script")
+            return
+        script = self.scripts[selected[0]]
+        by_name = {os.path.basename(other["file_path"]): other["id"] for other in self.scripts.values()}
+        current = ", ".join(os.path.basename(self.scripts[script_id]["file_path"])
+                            for script_id in script.get("depends_on") or () if script_id in self.scripts)
+        names = simpledialog.askstring(
+            "Set Dependencies", f"Run {os.path.basename(script['file_path'])} after these scripts succeed "
+                                f"(comma-separated file names, empty for none):", initialvalue=current)
+        if names is None:
+            return
+        names = [name.strip() for name in names.split(",") if name.strip()]
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            messagebox.showerror("Error", f"Not registered: {', '.join(unknown)}")
+            return
+        try:
+            self.client.set_pipeline(script["id"], depends_on=[by_name[name] for name in names])
+        except DaemonError as e:
+            messagebox.showerror("Error", str(e))
+
+    def rerun_failed(self):
+        runs = self.call_daemon(self.client.rerun_failed)
+        if runs is not None and not runs:
+            messagebox.showinfo("Rerun Failed", "No failed scripts")
+
+    def poll_daemon_events(self):
+        """Long-poll the daemon for events and queue them for the Tk thread. Runs on a background thread."""
+        since = None
+        while True:
+            try:
+                if since is None:
+                    # (Re)connected: start from the daemon's current position and resync the views
+                    since = self.client.status()["last_event"]
+                    self.ui_events.put(("connected", None))
+                events = self.client.events(since, timeout=EVENT_POLL_TIMEOUT)
+                if events and events[0]["seq"] > since + 1:
+                    self.ui_events.put(("connected", None))  # Fell behind and missed events; resync the views
+                for event in events:
+                    since = event["seq"]
+                    self.ui_events.put(("event", event))
+            except DaemonError as e:
+                if since is not None:
+                    self.ui_events.put(("disconnected", str(e)))
+                since = None
+                time.sleep(RECONNECT_DELAY)
+
+    def process_ui_events(self):
+        """Apply events from the daemon in one batch. Runs on the Tk main thread."""
+        refresh_scripts = refresh_jobs = False
+        output = []
         try:
-            process = subprocess.Popen(["python", file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
-            if capture_output:
-                self.display_output(file_path, stdout, stderr)
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.logs.append(f"{timestamp} - Executed {os.path.basename(file_path)}")
-            messagebox.showinfo("Success", f"Running {os.path.basename(file_path)}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to run script: {e}")
-
-    def display_output(self, file_path, stdout, stderr):
+            while True:
+                kind, payload = self.ui_events.get_nowait()
+                if kind == "connected":
+                    self.root.title("Python Script Scheduler")
+                    refresh_scripts = refresh_jobs = True
+                elif kind == "disconnected":
+                    self.root.title("Python Script Scheduler (daemon unreachable, retrying)")
+                elif payload["kind"] == "scripts_changed" and not refresh_scripts:
+                    self.apply_script_changes(payload["changed"], payload["removed"])
+                elif payload["kind"] == "jobs_changed" and not refresh_jobs:
+                    if payload.get("reset"):
+                        refresh_jobs = True
+                    else:
+                        self.update_jobs_tree(payload["changed"], payload["removed"])
+                elif payload["kind"] == "output":
+                    output.append(payload)
+                elif payload["kind"] == "output_dropped":
+                    output.append({"run_id": None, "stream": None,
+                                   "text": f"\n... {payload['chars']} characters skipped, see the run log ...\n"})
+                elif payload["kind"] == "run_started":
+                    self.set_job_running(payload["run"]["file_path"], 1)
+                elif payload["kind"] == "run_finished":
+                    self.write_output(output)
+                    output = []
+                    self.on_run_complete(payload["run"])
+                elif payload["kind"] == "run_skipped":
+                    self.display_output(payload["file_path"], "skipped, already running")
+                elif payload["kind"] == "step_cached":
+                    self.display_output(payload["file_path"], "skipped, script and inputs unchanged")
+                elif payload["kind"] == "step_blocked":
+                    self.display_output(payload["file_path"], "skipped, waiting on upstream steps")
+                elif payload["kind"] == "alert":
+                    self.write_output(output)
+                    output = []
+                    self.display_output(payload["script"], f"ALERT: {payload['message']}")
+        except queue.Empty:
+            pass
+        self.write_output(output)
+        if refresh_scripts:
+            self.load_scripts()
+        if refresh_jobs:
+            self.update_jobs_tree()
+        self.root.after(UI_POLL_INTERVAL_MS, self.process_ui_events)
+
+    def set_job_running(self, file_path, change):
+        self.running[file_path] = max(0, self.running.get(file_path, 0) + change)
+        job_id = self.script_ids.get(file_path)
+        if job_id is not None and self.scheduled_jobs_tree.exists(job_id):
+            self.scheduled_jobs_tree.item(job_id, tags=("running",) if self.running[file_path] else ())
+
+    def on_run_complete(self, run):
+        self.set_job_running(run["file_path"], -1)
+        if run["error"] is not None:
+            messagebox.showerror("Error", f"Failed to run script: {run['error']}")
+            return
+        self.display_output(run["file_path"], f"{run['status']}, exit code {run['returncode']}, {run['mode']} run "
+                                              f"{run['duration']:.3f} s, log: {run['log_path']}")
+
+    def write_output(self, events):
+        """Append a batch of output events to the output panel in a single update."""
+        if not events:
+            return
         self.output_panel.config(state=tk.NORMAL)
-        self.output_panel.delete(1.0, tk.END)
-        file_name = os.path.basename(file_path)
-        self.output_panel.insert(tk.END, f"Output for: {file_name}\n\n")
-        if stdout:
-            self.output_panel.insert(tk.END, f"Output:\n{stdout}\n")
-        if stderr:
-            self.output_panel.insert(tk.END, f"Error:\n{stderr}\n")
+        for event in events:
+            if event["run_id"] is None:
+                self.output_source = None
+            elif self.output_source != (event["run_id"], event["stream"]):
+                label = "Output" if event["stream"] == "stdout" else "Error"
+                self.output_panel.insert(tk.END, f"\n[{os.path.basename(event['file_path'])} - {label}]\n")
+                self.output_source = (event["run_id"], event["stream"])
+            self.output_panel.insert(tk.END, event["text"])
+        self.trim_output_panel()
+        self.output_panel.see(tk.END)
         self.output_panel.config(state=tk.DISABLED)
 
-    def start_scheduler(self):
-        def scheduler_thread():
-            while True:
-                schedule.run_pending()
-                time.sleep(1)
+    def display_output(self, file_path, summary):
+        self.output_panel.config(state=tk.NORMAL)
+        self.output_panel.insert(tk.END, f"\n[{os.path.basename(file_path)}] {summary}\n")
+        self.output_source = None
+        self.trim_output_panel()
+        self.output_panel.see(tk.END)
+        self.output_panel.config(state=tk.DISABLED)
+
+    def trim_output_panel(self):
+        line_count = int(self.output_panel.index("end-1c").split(".")[0])
+        if line_count > MAX_OUTPUT_PANEL_LINES:
+            self.output_panel.delete(1.0, f"{line_count - MAX_OUTPUT_PANEL_LINES + 1}.0")
 
-        thread = threading.Thread(target=scheduler_thread, daemon=True)
-        thread.start()
-        messagebox.showinfo("Scheduler", "Scheduler started in the background")
+    def start_scheduler(self):
+        started = self.call_daemon(self.client.start_scheduler)
+        if started:
+            messagebox.showinfo("Scheduler", "Scheduler started in the background")
+        elif started is not None:
+            messagebox.showinfo("Scheduler", "Scheduler is already running")
 
     def clear_scheduled_jobs(self):
-        self.scheduled_jobs_tree.delete(*self.scheduled_jobs_tree.get_children())
-        self.jobs.clear()
-        schedule.clear()
+        try:
+            self.client.clear_jobs()
+        except DaemonError as e:
+            messagebox.showerror("Error", str(e))
+            return
         messagebox.showinfo("Clear Jobs", "All scheduled jobs have been cleared")
 
     def show_logs(self):
-        logs_window = Toplevel(self.root)
-        logs_window.title("Execution Logs")
-        logs_window.geometry("600x400")
-        log_text = scrolledtext.ScrolledText(logs_window, wrap=tk.WORD, width=70, height=20)
-        log_text.pack(pady=10)
-        log_text.insert(tk.END, "\n".join(self.logs))
-        log_text.config(state=tk.DISABLED)
+        status = self.call_daemon(self.client.status)
+        if status is not None:
+            HistoryWindow(self.root, self.client, status["mode_stats"])
+
+    def show_stats(self):
+        StatsWindow(self.root, self.client)
 
     def show_about(self):
         messagebox.showinfo("About", "Python Script Scheduler\nVersion 1.0\nCreated by [Your Name]")
 
 
+class HistoryWindow:
+    """Paginated, filterable view of the run history. Only the visible page is queried."""
+
+    def __init__(self, root, history, mode_stats):
+        self.history = history
+        self.first_key = None  # (started_at, id) of the first and last rows shown
+        self.last_key = None
+
+        self.window = Toplevel(root)
+        self.window.title("Execution Logs")
+        self.window.geometry("900x500")
+        mode_text = "\n".join(
+            f"{mode}: {stats['runs']} runs, mean run {stats['mean_duration']:.3f} s"
+            for mode, stats in mode_stats.items())
+        tk.Label(self.window, text=mode_text or "No completed runs yet", justify=tk.LEFT).pack(pady=5)
+
+        filters = tk.Frame(self.window)
+        filters.pack(pady=5)
+        tk.Label(filters, text="Script contains:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(filters, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind("<Return>", lambda event: self.load_page())
+        tk.Label(filters, text="Status:").pack(side=tk.LEFT)
+        self.status_var = tk.StringVar()
+        ttk.Combobox(filters, textvariable=self.status_var, width=14, state="readonly",
+                     values=("", "finished", "failed", "timed out", "launch failed", "skipped", "cached",
+                             "blocked")).pack(side=tk.LEFT, padx=5)
+        tk.Button(filters, text="Filter", command=self.load_page).pack(side=tk.LEFT, padx=5)
+
+        columns = ("Started", "Script", "Status", "Exit Code", "Duration", "CPU", "Peak RSS", "Drift", "Mode",
+                   "Scheduled")
+        self.tree = ttk.Treeview(self.window, columns=columns, show="headings", height=HISTORY_PAGE_SIZE // 5)
+        for column, width in zip(columns, (140, 180, 70, 60, 70, 60, 80, 60, 50, 140)):
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=width)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.tree.bind("<Double-1>", self.show_run_output)
+        self.output_paths = {}
+
+        navigation = tk.Frame(self.window)
+        navigation.pack(pady=5)
+        tk.Button(navigation, text="< Newer", command=lambda: self.load_page(after=self.first_key)).pack(side=tk.LEFT)
+        tk.Button(navigation, text="Older >", command=lambda: self.load_page(before=self.last_key)).pack(side=tk.LEFT)
+
+        self.load_page()
+
+    def load_page(self, before=None, after=None):
+        try:
+            rows = self.history.page(search=self.search_var.get().strip() or None,
+                                     status=self.status_var.get() or None, before=before, after=after,
+                                     limit=HISTORY_PAGE_SIZE)
+        except DaemonError as e:
+            messagebox.showerror("Error", str(e), parent=self.window)
+            return
+        if not rows and (before or after):
+            return  # Already on the first or last page
+        self.tree.delete(*self.tree.get_children())
+        self.output_paths.clear()
+        for row in rows:
+            item = self.tree.insert("", tk.END, values=(
+                self.format_time(row["started_at"]), os.path.basename(row["script"]), row["status"],
+                "" if row["exit_code"] is None else row["exit_code"],
+                "" if row["duration"] is None else f"{row['duration']:.2f} s",
+                "" if row["cpu_user"] is None else f"{row['cpu_user'] + row['cpu_system']:.2f} s",
+                "" if row["max_rss"] is None else f"{row['max_rss'] / 2 ** 20:.1f} MiB",
+                "" if row["drift"] is None else f"{row['drift']:.2f} s", row["mode"] or "",
+                self.format_time(row["scheduled_at"])))
+            self.output_paths[item] = row["output_path"]
+        self.first_key = (rows[0]["started_at"], rows[0]["id"]) if rows else None
+        self.last_key = (rows[-1]["started_at"], rows[-1]["id"]) if rows else None
+
+    def show_run_output(self, event):
+        item = self.tree.focus()
+        if not item:
+            return
+        output_window = Toplevel(self.window)
+        output_window.title(f"Output: {self.tree.item(item, 'values')[1]}")
+        output_text = scrolledtext.ScrolledText(output_window, wrap=tk.WORD, width=100, height=30)
+        output_text.pack(pady=10)
+        try:
+            text = self.history.output_tail(self.output_paths[item]) if self.output_paths.get(item) else ""
+        except DaemonError as e:
+            text = str(e)
+        output_text.insert(tk.END, text or "No output recorded")
+        output_text.config(state=tk.DISABLED)
+
+    @staticmethod
+    def format_time(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else ""
+
+
+class StatsWindow:
+    """Per-script run statistics and recent alerts, refreshed while the window is open."""
+
+    COLUMNS = (  # heading, stats key, width, formatter
+        ("Script", "script", 200, os.path.basename),
+        ("Runs", "runs", 50, str),
+        ("Failed", "failed", 50, str),
+        ("p50", "p50_duration", 70, lambda value: f"{value:.2f} s"),
+        ("p95", "p95_duration", 70, lambda value: f"{value:.2f} s"),
+        ("Max", "max_duration", 70, lambda value: f"{value:.2f} s"),
+        ("CPU Total", "cpu_total", 80, lambda value: f"{value:.1f} s"),
+        ("Mean CPU", "mean_cpu", 70, lambda value: f"{value:.2f} s"),
+        ("Peak RSS", "peak_rss", 80, lambda value: f"{value / 2 ** 20:.1f} MiB"),
+        ("p95 Drift", "p95_drift", 70, lambda value: f"{value:.2f} s"),
+        ("Alerts", "alerts", 50, str),
+    )
+
+    def __init__(self, root, client):
+        self.client = client
+        self.sort_key = "cpu_total"  # Biggest CPU consumers first
+        self.stats = {"scripts": [], "alerts": []}
+
+        self.window = Toplevel(root)
+        self.window.title("Run Stats")
+        self.window.geometry("900x500")
+        self.engine_label = tk.Label(self.window, justify=tk.LEFT)
+        self.engine_label.pack(pady=5)
+
+        self.tree = ttk.Treeview(self.window, columns=[column[0] for column in self.COLUMNS], show="headings",
+                                 height=12)
+        for heading, key, width, _ in self.COLUMNS:
+            self.tree.heading(heading, text=heading, command=lambda key=key: self.sort_by(key))
+            self.tree.column(heading, width=width)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        tk.Label(self.window, text="Recent Alerts:").pack(pady=5)
+        self.alerts_panel = scrolledtext.ScrolledText(self.window, wrap=tk.WORD, width=100, height=8, state=tk.DISABLED)
+        self.alerts_panel.pack(padx=10, pady=5)
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.window.winfo_exists():
+            return
+        try:
+            self.stats = self.client.stats()
+        except DaemonError as e:
+            self.engine_label.config(text=str(e))
+        else:
+            engine = self.stats["engine"]
+            self.engine_label.config(text=f"Workers: {engine['workers']}, running: {engine['running']}, "
+                                          f"queued: {engine['queued']}")
+            self.show()
+        self.window.after(STATS_REFRESH_MS, self.refresh)
+
+    def sort_by(self, key):
+        self.sort_key = key
+        self.show()
+
+    def show(self):
+        scripts = sorted(self.stats["scripts"], key=lambda script: (script[self.sort_key] is not None,
+                                                                    script[self.sort_key]), reverse=True)
+        self.tree.delete(*self.tree.get_children())
+        for script in scripts:
+            self.tree.insert("", tk.END, values=[
+                "" if script[key] is None else formatter(script[key]) for _, key, _, formatter in self.COLUMNS])
+        self.alerts_panel.config(state=tk.NORMAL)
+        self.alerts_panel.delete(1.0, tk.END)
+        for alert in reversed(self.stats["alerts"]):
+            self.alerts_panel.insert(tk.END, f"{alert['time']}  {os.path.basename(alert['script'])}: "
+                                             f"{alert['message']}\n")
+        self.alerts_panel.config(state=tk.DISABLED)
+
+
 # Main application
 if __name__ == "__main__":
+    client = SchedulerClient(DAEMON_ADDRESS)
     root = tk.Tk()
-    app = PythonScriptScheduler(root)
-    root.mainloop()
\ No newline at end of file
+    try:
+        client.ensure_daemon()
+    except DaemonError as e:
+        root.withdraw()
+        messagebox.showerror("Error", str(e))
+    else:
+        app = PythonScriptScheduler(root, client)
+        root.mainloop()
\ No newline at end of file
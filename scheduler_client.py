@@ -0,0 +1,292 @@
+import argparse
+import codecs
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from daemon import DEFAULT_ADDRESS, TOKEN_FILE, parse_address, read_token
+
+CONNECT_TIMEOUT = 10  # Seconds allowed for a request, on top of any long-poll wait
+DAEMON_START_TIMEOUT = 10  # Seconds to wait for a spawned daemon to accept connections
+
+
+class DaemonError(Exception):
+    """The daemon could not be reached or rejected a request."""
+
+
+def _history_key(key):
+    """Encode a (started_at, id) history page key for the query string."""
+    return f"{key[0]!r},{key[1]}" if key else None
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class SchedulerClient:
+    """Client for the scheduler daemon's control API (see daemon.py)."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, token_file=TOKEN_FILE):
+        self.address = address
+        self.token_file = token_file
+
+    def _headers(self):
+        """The API token a TCP daemon requires; read on every request, as a restarted daemon writes a new one."""
+        if parse_address(self.address)[0] != "tcp":
+            return {}
+        token = read_token(self.token_file)
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _connection(self, timeout):
+        kind, target = parse_address(self.address)
+        if kind == "tcp":
+            return http.client.HTTPConnection(*target, timeout=timeout)
+        return UnixHTTPConnection(target, timeout=timeout)
+
+    def _request(self, method, path, body=None, query=None, wait=0):
+        if query:
+            path = f"{path}?{urlencode({key: value for key, value in query.items() if value is not None})}"
+        connection = self._connection(CONNECT_TIMEOUT + wait)
+        try:
+            headers = self._headers()
+            data = None
+            if method == "POST":
+                data = json.dumps(body or {}).encode()
+                headers["Content-Type"] = "application/json"
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            payload = json.loads(response.read() or b"{}")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            raise DaemonError(f"Cannot reach scheduler daemon at {self.address}: {e}") from e
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise DaemonError(payload.get("error", f"HTTP {response.status}"))
+        return payload
+
+    def ping(self):
+        try:
+            self.status()
+            return True
+        except DaemonError:
+            return False
+
+    def ensure_daemon(self):
+        """Start a daemon in the background if none is answering. It keeps running after this process exits."""
+        if self.ping():
+            return
+        daemon_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "daemon.py")
+        subprocess.Popen([sys.executable, daemon_script, "--address", self.address, "--token-file", self.token_file,
+                          "--paused"],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.ping():
+                return
+            time.sleep(0.1)
+        raise DaemonError(f"Scheduler daemon did not start on {self.address}")
+
+    def status(self):
+        return self._request("GET", "/status")
+
+    def list_scripts(self):
+        return self._request("GET", "/scripts")["scripts"]
+
+    def add_script(self, file_path, time=None):
+        """Register a script. Returns it, or None if the file is already registered."""
+        return self._request("POST", "/scripts/add", {"file_path": file_path, "time": time})["script"]
+
+    # Scripts are named by id, or by file path with file_path=
+
+    def remove_script(self, script_id=None, file_path=None):
+        self._request("POST", "/scripts/remove", {"id": script_id, "file_path": file_path})
+
+    def schedule_script(self, script_id=None, time=None, file_path=None):
+        self._request("POST", "/scripts/schedule", {"id": script_id, "file_path": file_path, "time": time})
+
+    def run_script(self, script_id=None, file_path=None):
+        """Queue a run. Returns the run as a dict, or None if skipped because the script is still running."""
+        return self._request("POST", "/scripts/run", {"id": script_id, "file_path": file_path})["run"]
+
+    def set_pipeline(self, script_id=None, depends_on=None, inputs=None, outputs=None, file_path=None):
+        """Set a script's upstream scripts (ids or file paths) and input and output files; None keeps a value."""
+        return self._request("POST", "/scripts/pipeline", {"id": script_id, "file_path": file_path,
+                                                           "depends_on": depends_on, "inputs": inputs,
+                                                           "outputs": outputs})["script"]
+
+    def pipeline(self):
+        return self._request("GET", "/pipeline")
+
+    def rerun_failed(self):
+        """Run every failed pipeline step. Returns the runs started."""
+        return self._request("POST", "/pipeline/rerun-failed")["runs"]
+
+    def list_jobs(self):
+        return self._request("GET", "/jobs")["jobs"]
+
+    def clear_jobs(self):
+        self._request("POST", "/jobs/clear")
+
+    def start_scheduler(self):
+        return self._request("POST", "/scheduler/start")["started"]
+
+    def events(self, since=0, timeout=0):
+        """Return events newer than `since`, waiting up to `timeout` seconds for one."""
+        return self._request("GET", "/events", query={"since": since, "timeout": timeout}, wait=timeout)["events"]
+
+    def page(self, search=None, status=None, before=None, after=None, limit=100):
+        """Return a page of run history; same arguments as RunHistory.page."""
+        return self._request("GET", "/runs", query={"search": search, "status": status,
+                                                    "before": _history_key(before), "after": _history_key(after),
+                                                    "limit": limit})["runs"]
+
+    def stats(self):
+        """Per-script run statistics and recent alerts."""
+        return self._request("GET", "/stats")
+
+    def output_tail(self, path, max_bytes=64 * 1024):
+        return self._request("GET", "/output", query={"path": path, "max_bytes": max_bytes})["text"]
+
+    def stream_output(self, run_id):
+        """Yield a run's output as text until the run ends."""
+        connection = self._connection(None)
+        try:
+            connection.request("GET", f"/runs/{run_id}/output", headers=self._headers())
+            response = connection.getresponse()
+            if response.status != 200:
+                raise DaemonError(json.loads(response.read() or b"{}").get("error", f"HTTP {response.status}"))
+            # Characters may span chunk boundaries
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                chunk = response.read1(64 * 1024)
+                if not chunk:
+                    tail = decoder.decode(b"", final=True)
+                    if tail:
+                        yield tail
+                    return
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        except (OSError, http.client.HTTPException) as e:
+            raise DaemonError(f"Lost connection to scheduler daemon: {e}") from e
+        finally:
+            connection.close()
+
+    def shutdown(self):
+        self._request("POST", "/shutdown")
+
+
+def _format_stat(value):
+    if value is None:
+        return "-"
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def _absolute_paths(paths):
+    return [os.path.abspath(path) for path in paths] if paths is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control a running scheduler daemon.")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    parser.add_argument("--token-file", default=TOKEN_FILE, help="API token of a daemon listening on TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    commands.add_parser("list")
+    commands.add_parser("jobs")
+    commands.add_parser("stats")
+    commands.add_parser("pipeline")
+    command = commands.add_parser("depend", help="Declare a script's upstream scripts and input/output files")
+    command.add_argument("file_path")
+    command.add_argument("--on", nargs="*", metavar="UPSTREAM", help="Scripts that must succeed first")
+    command.add_argument("--inputs", nargs="*", metavar="FILE")
+    command.add_argument("--outputs", nargs="*", metavar="FILE")
+    commands.add_parser("rerun-failed")
+    for name in ("add", "schedule"):
+        command = commands.add_parser(name)
+        command.add_argument("file_path", nargs="+")
+        command.add_argument("--time", help="HH:MM, 'every 15m', a cron expression or 'YYYY-MM-DD HH:MM'")
+    for name in ("remove", "run"):
+        commands.add_parser(name).add_argument("file_path", nargs="+")
+    commands.add_parser("tail").add_argument("run_id", type=int)
+    commands.add_parser("start")
+    commands.add_parser("shutdown")
+    args = parser.parse_args(argv)
+
+    client = SchedulerClient(args.address, args.token_file)
+    try:
+        if args.command == "status":
+            print(json.dumps(client.status(), indent=2))
+        elif args.command == "list":
+            for script in client.list_scripts():
+                print(f"{script['id']}\t{script['file_path']}\t{script.get('time') or 'Not Scheduled'}")
+        elif args.command == "jobs":
+            for job in client.list_jobs():
+                print(f"{job['id']}\t{job['file_path']}\t{job['time']}\tnext {job['next_fire']}")
+        elif args.command == "stats":
+            stats = client.stats()
+            print("runs\tfailed\tp50 s\tp95 s\tcpu s\tpeak MiB\tp95 drift s\tscript")
+            for script in sorted(stats["scripts"], key=lambda script: script["cpu_total"], reverse=True):
+                peak_rss = script["peak_rss"] / 2 ** 20 if script["peak_rss"] is not None else None
+                print("\t".join(_format_stat(value) for value in (
+                    script["runs"], script["failed"], script["p50_duration"], script["p95_duration"],
+                    script["cpu_total"], peak_rss, script["p95_drift"], script["script"])))
+            for alert in stats["alerts"]:
+                print(f"{alert['time']} {alert['script']}: {alert['message']}")
+        elif args.command == "pipeline":
+            pipeline = client.pipeline()
+            if pipeline["error"]:
+                print(f"Error: {pipeline['error']}", file=sys.stderr)
+            names = {step["id"]: os.path.basename(step["file_path"]) for step in pipeline["steps"]}
+            for step in pipeline["steps"]:
+                if step["upstream"] or step["downstream"]:
+                    after = ", ".join(names[upstream_id] for upstream_id in step["upstream"]) or "-"
+                    print(f"{step['id']}\t{step['last_status'] or 'never run'}\tafter {after}\t{step['file_path']}")
+        elif args.command == "depend":
+            client.set_pipeline(file_path=os.path.abspath(args.file_path), depends_on=_absolute_paths(args.on),
+                                inputs=_absolute_paths(args.inputs), outputs=_absolute_paths(args.outputs))
+        elif args.command == "rerun-failed":
+            for run in client.rerun_failed():
+                print(f"{run['file_path']}: run {run['run_id']}")
+        elif args.command == "add":
+            for file_path in args.file_path:
+                client.add_script(os.path.abspath(file_path), args.time)
+        elif args.command == "schedule":
+            for file_path in args.file_path:
+                client.schedule_script(time=args.time, file_path=os.path.abspath(file_path))
+        elif args.command == "remove":
+            for file_path in args.file_path:
+                client.remove_script(file_path=os.path.abspath(file_path))
+        elif args.command == "run":
+            for file_path in args.file_path:
+                run = client.run_script(file_path=os.path.abspath(file_path))
+                print(f"{file_path}: run {run['run_id']}" if run else f"{file_path}: skipped, already running")
+        elif args.command == "tail":
+            for text in client.stream_output(args.run_id):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+        elif args.command == "start":
+            print("Scheduler started" if client.start_scheduler() else "Scheduler is already running")
+        elif args.command == "shutdown":
+            client.shutdown()
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,561 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from executor import ExecutionEngine, MODE_COLD, OVERLAP_SKIP
+from output_capture import OutputBatcher
+from pipeline import PipelineGraph, StepHasher
+from run_history import RunHistory
+from run_metrics import RunMetrics
+from script_registry import ScriptRegistry
+from timer_scheduler import MISFIRE_RUN_ONCE, get_scheduler, parse_trigger
+
+SCRIPT_STORAGE_FILE = "scripts.json"
+MAX_WORKERS = os.cpu_count() or 1  # Concurrent script processes
+DEFAULT_TIMEOUT = None  # Seconds before a runaway script is killed, None to never kill
+OVERLAP_POLICY = OVERLAP_SKIP  # Skip a run if the script is still running, or OVERLAP_QUEUE to queue it
+PYTHON_INTERPRETER = "python"  # Default interpreter; a script can pin its own with a "python" entry
+EXECUTION_MODE = MODE_COLD  # MODE_WARM forks scripts from a pre-warmed interpreter (see warm_pool.PRELOAD_MODULES)
+DEFAULT_MISFIRE = MISFIRE_RUN_ONCE  # Catch-up policy for runs missed while the scheduler was not running
+OUTPUT_FLUSH_INTERVAL = 0.1  # Seconds between output events while runs are printing
+OUTPUT_EVENT_CHARS = 64 * 1024  # Live output published per flush; beyond that only the run's log file has it
+MAX_EVENTS = 5000  # Events kept for clients that poll
+MAX_EVENT_CHARS = 4 * 1024 * 1024  # Output text kept across those events
+RECENT_RUNS = 1000  # Finished runs kept addressable by run id
+REGISTRY_POLL_INTERVAL = 2  # Seconds between checks for outside edits to the storage file
+METRICS_FILE = "metrics.prom"  # Prometheus text file kept up to date for node_exporter's textfile collector, or None
+METRICS_EXPORT_INTERVAL = 15  # Seconds between rewrites of the metrics file, when anything changed
+METRICS_HISTORY_DAYS = 30  # Days of run history replayed into the metrics at startup
+
+
+class EventLog:
+    """Bounded, sequence-numbered log of events that clients long-poll for.
+
+    A client passes the last sequence number it saw and gets everything newer. Old events are
+    dropped once the log is full, so a client that falls far behind skips ahead rather than
+    holding memory.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS, max_chars=MAX_EVENT_CHARS):
+        self.max_chars = max_chars
+        self._events = deque(maxlen=max_events)  # (seq, event)
+        self._chars = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def publish(self, kind, **data):
+        with self._cond:
+            self._seq += 1
+            data.update(seq=self._seq, kind=kind, time=datetime.now().isoformat(timespec="milliseconds"))
+            if len(self._events) == self._events.maxlen:
+                self._chars -= len(self._events[0][1].get("text", ""))
+            self._events.append((self._seq, data))
+            self._chars += len(data.get("text", ""))
+            while self._chars > self.max_chars and len(self._events) > 1:
+                self._chars -= len(self._events.popleft()[1].get("text", ""))
+            self._cond.notify_all()
+
+    def since(self, seq, timeout=None):
+        """Return events newer than seq, waiting up to timeout seconds for one to arrive."""
+        with self._cond:
+            if self._seq <= seq:
+                self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return [event for event_seq, event in self._events if event_seq > seq]
+
+    @property
+    def last_seq(self):
+        with self._cond:
+            return self._seq
+
+
+def run_to_dict(run):
+    return {
+        "run_id": run.run_id,
+        "file_path": run.file_path,
+        "status": run.status,
+        "returncode": run.returncode,
+        "mode": run.mode,
+        "launch_latency": run.launch_latency,
+        "duration": run.duration,
+        "cpu_user": run.rusage["utime"] if run.rusage else None,
+        "cpu_system": run.rusage["stime"] if run.rusage else None,
+        "max_rss": run.max_rss,
+        "drift": run.drift,
+        "log_path": run.log_path,
+        "error": str(run.error) if run.error is not None else None,
+        "scheduled_for": run.scheduled_for.isoformat() if run.scheduled_for else None,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+class SchedulerCore:
+    """Headless scheduler: the script registry, timer, execution engine and run history.
+
+    All methods are thread-safe; the control API calls them from its request threads. Anything
+    clients need to see as it happens is published to `events`.
+    """
+
+    def __init__(self, storage_file=SCRIPT_STORAGE_FILE, history=None):
+        self.registry = ScriptRegistry(storage_file)
+        self.events = EventLog()
+        self.history = history or RunHistory()
+        self.metrics = RunMetrics()
+        self.metrics.observe_history(self.history.runs_since(time.time() - METRICS_HISTORY_DAYS * 86400))
+        self.timer = get_scheduler()
+        self._lock = threading.RLock()
+        self._runs = OrderedDict()  # run id -> ScriptRun, active and recently finished
+        self._run_hashes = {}  # run id -> step hash of the script and inputs it was started with
+        self.hasher = StepHasher()
+        self._graph = None  # PipelineGraph, rebuilt on first use after the registry changes
+        self._graph_error = None
+        self._steps = queue.Queue()  # (function, args) of pipeline work, run in order off the timer and worker threads
+        self._output = OutputBatcher(OUTPUT_EVENT_CHARS)
+        self._output_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.engine = ExecutionEngine(max_workers=MAX_WORKERS, overlap=OVERLAP_POLICY,
+                                      default_timeout=DEFAULT_TIMEOUT, python=PYTHON_INTERPRETER,
+                                      mode=EXECUTION_MODE, on_start=self._on_run_start,
+                                      on_output=self._output.add, on_complete=self._on_run_complete)
+        self._step_thread = threading.Thread(target=self._run_steps, name="pipeline-steps", daemon=True)
+        self._step_thread.start()
+        threading.Thread(target=self._pump_output, name="output-events", daemon=True).start()
+        threading.Thread(target=self._watch_registry, name="registry-watcher", daemon=True).start()
+        threading.Thread(target=self._export_metrics, name="metrics-export", daemon=True).start()
+
+    # Registry
+
+    def list_scripts(self):
+        with self._lock:
+            return [dict(script) for script in self.registry.all()]
+
+    def resolve(self, script_id=None, file_path=None):
+        """Return the script with this id, or else this file path; raises KeyError if there is none."""
+        with self._lock:
+            if script_id:
+                return self.registry.get(script_id)
+            script = self.registry.find_by_path(file_path) if file_path else None
+            if script is None:
+                raise KeyError(f"Unknown script: {script_id or file_path}")
+            return script
+
+    def add_script(self, file_path, time=None):
+        """Register a script. Returns it, or None if the file is already registered."""
+        if time:
+            parse_trigger(time)
+        with self._lock:
+            script = self.registry.add(file_path, time=time)
+            if script is None:
+                return None
+            script = dict(script)
+            self._graph = None
+        self.events.publish("scripts_changed", changed=[script], removed=[])
+        return script
+
+    def remove_script(self, script_id):
+        with self._lock:
+            self.registry.remove(script_id)
+            job = self.timer.remove_job(script_id)
+            self._graph = None
+        self.events.publish("scripts_changed", changed=[], removed=[script_id])
+        if job is not None:
+            self.events.publish("jobs_changed", changed=[], removed=[script_id])
+
+    def _watch_registry(self):
+        """Pick up edits other programs make to the storage file."""
+        while not self._stopping.wait(REGISTRY_POLL_INTERVAL):
+            with self._lock:
+                result = self.registry.reload_if_changed()
+                if result is None:
+                    continue
+                changed, removed = result
+                self._graph = None
+                changed_jobs, removed_jobs = [], []
+                for script_id in removed:
+                    if self.timer.remove_job(script_id) is not None:
+                        removed_jobs.append(script_id)
+                for script in changed:
+                    job = self.timer.get_job(script["id"])
+                    if script.get("scheduled") and script.get("time"):
+                        if job is None or job.trigger.spec != script["time"]:
+                            try:
+                                job = self._add_job(script, parse_trigger(script["time"]))
+                            except ValueError:
+                                continue
+                            changed_jobs.append(self._job_to_dict(job))
+                    elif job is not None:
+                        self.timer.remove_job(script["id"])
+                        removed_jobs.append(script["id"])
+                changed = [dict(script) for script in changed]
+            self.events.publish("scripts_changed", changed=changed, removed=removed)
+            if changed_jobs or removed_jobs:
+                self.events.publish("jobs_changed", changed=changed_jobs, removed=removed_jobs)
+
+    # Scheduling
+
+    def schedule_script(self, script_id, time=None):
+        """Schedule the script at `time`, or at its saved time if none is given."""
+        with self._lock:
+            script = self.registry.get(script_id)
+            time = time or script["time"]
+            if not time:
+                raise ValueError("No schedule time given")
+            trigger = parse_trigger(time)
+            if trigger.next_after(datetime.now()) is None:
+                raise ValueError(f"Schedule time {time} has already passed")
+            script = dict(self.registry.update(script_id, time=time, scheduled=True))
+            job = self._job_to_dict(self._add_job(script, trigger))
+        self.events.publish("scripts_changed", changed=[script], removed=[])
+        self.events.publish("jobs_changed", changed=[job], removed=[])
+
+    def restore_jobs(self):
+        """Re-add the jobs of every script that was scheduled when the scheduler last ran."""
+        with self._lock:
+            for script in self.registry.all():
+                if script.get("scheduled") and script.get("time"):
+                    try:
+                        self._add_job(script, parse_trigger(script["time"]), restore=True)
+                    except ValueError:
+                        self.registry.update(script["id"], scheduled=False)
+        self.events.publish("jobs_changed", changed=self.list_jobs(), removed=[])
+
+    def _add_job(self, script, trigger, restore=False):
+        """Register the script's job.
+
+        Only jobs restored at startup catch up on fire times missed since the script's last run; a new
+        or changed schedule counts from now, so rescheduling never looks like a missed run.
+        """
+        last_run = None
+        if restore and script.get("last_run"):
+            last_run = datetime.fromisoformat(script["last_run"])
+        return self.timer.add_job(script["id"], trigger, self._on_job_due,
+                                  misfire=script.get("misfire", DEFAULT_MISFIRE), last_run=last_run)
+
+    def _job_to_dict(self, job):
+        script = self.registry.get(job.job_id) if job.job_id in self.registry else {}
+        return {"id": job.job_id, "file_path": script.get("file_path"), "time": job.trigger.spec,
+                "next_fire": job.next_fire.isoformat() if job.next_fire else None}
+
+    def list_jobs(self):
+        return [self._job_to_dict(job) for job in self.timer.jobs()]
+
+    def clear_jobs(self):
+        with self._lock:
+            self.timer.clear()
+            for script in self.registry.all():
+                if script.get("scheduled"):
+                    self.registry.update(script["id"], scheduled=False)
+        self.events.publish("jobs_changed", changed=[], removed=[], reset=True)
+
+    def start_scheduler(self):
+        """Start firing scheduled jobs. Returns False if the scheduler was already running."""
+        started = self.timer.start()
+        self.events.publish("status_changed")
+        return started
+
+    def _on_job_due(self, job, scheduled_time):
+        """Called on the scheduler thread when a job fires. The step itself starts on the pipeline thread,
+        so hashing its inputs does not hold up other jobs."""
+        with self._lock:
+            # Persist the last fire time so runs missed while the scheduler is down can be caught up
+            fields = {"last_run": scheduled_time.isoformat(timespec="seconds")}
+            if job.next_fire is None:
+                fields["scheduled"] = False  # One-shot jobs are done once they have fired
+            try:
+                self.registry.update(job.job_id, **fields)
+            except KeyError:
+                return
+        self._steps.put((self._fire_step, (job.job_id, scheduled_time)))
+        if job.next_fire is None:
+            self.events.publish("jobs_changed", changed=[], removed=[job.job_id])
+
+    # Execution
+
+    def run_script(self, script_id, scheduled_for=None):
+        """Queue a run of the script. Returns the ScriptRun, or None if skipped because it is still running.
+
+        Unlike scheduled and pipeline runs, this runs the script even if its inputs are unchanged.
+        """
+        script = self.registry.get(script_id)
+        return self._submit(script, scheduled_for, self._step_hash(script))
+
+    def _submit(self, script, scheduled_for, step_hash):
+        file_path = script["file_path"]
+        run = self.engine.submit(file_path, priority=script.get("priority", 0), timeout=script.get("timeout"),
+                                 overlap=script.get("overlap"), max_concurrency=script.get("max_concurrency"),
+                                 python=script.get("python"), mode=script.get("mode"),
+                                 scheduled_for=scheduled_for)
+        if run is None:
+            self.history.record(file_path, datetime.now(), "skipped", scheduled_at=scheduled_for)
+            self.metrics.observe(file_path, "skipped")
+            self.events.publish("run_skipped", file_path=file_path)
+            return None
+        with self._lock:
+            self._runs[run.run_id] = run
+            if step_hash is not None:
+                self._run_hashes[run.run_id] = step_hash
+            if script["id"] in self.registry:
+                self.registry.update(script["id"], last_attempt=run.submitted_at.isoformat())
+            while len(self._runs) > RECENT_RUNS:
+                oldest = next(iter(self._runs.values()))
+                if not oldest.done.is_set():
+                    break
+                self._runs.popitem(last=False)
+        self.events.publish("run_queued", run=run_to_dict(run))
+        return run
+
+    def get_run(self, run_id):
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is None:
+            raise KeyError(f"Unknown run: {run_id}")
+        return run
+
+    def _on_run_start(self, run):
+        self.events.publish("run_started", run=run_to_dict(run))
+
+    def _on_run_complete(self, run):
+        self.history.record_run(run)
+        script = self.registry.find_by_path(run.file_path) or {}
+        alerts = self.metrics.observe(run.file_path, run.status, run.returncode, run.duration, run.cpu_time,
+                                      run.max_rss, run.drift, run_id=run.run_id,
+                                      slow_run_seconds=script.get("slow_run_seconds"),
+                                      memory_growth_factor=script.get("memory_growth_factor"))
+        self._flush_output()  # Output events of a run always precede its finished event
+        self.events.publish("run_finished", run=run_to_dict(run))
+        for alert in alerts:
+            self.events.publish("alert", **alert)
+        self._finish_step(run)
+
+    def _flush_output(self):
+        with self._output_lock:
+            chunks, dropped = self._output.drain()
+            if dropped:
+                self.events.publish("output_dropped", chars=dropped)
+            for run, stream, text in chunks:
+                self.events.publish("output", run_id=run.run_id, file_path=run.file_path, stream=stream, text=text)
+
+    def _pump_output(self):
+        """Publish output in batches. Idle until a run prints, then gather for OUTPUT_FLUSH_INTERVAL."""
+        while True:
+            self._output.pending.wait()
+            stopping = self._stopping.wait(OUTPUT_FLUSH_INTERVAL)
+            self._flush_output()
+            if stopping:
+                return
+
+    # Pipelines
+
+    def set_pipeline(self, script_id, depends_on=None, inputs=None, outputs=None):
+        """Set a script's upstream scripts (ids or file paths) and its input and output files.
+
+        Arguments left as None keep their current values. Raises ValueError if the change would
+        create a dependency cycle.
+        """
+        with self._lock:
+            fields = {}
+            if depends_on is not None:
+                fields["depends_on"] = [self.resolve(name if name in self.registry else None, name)["id"]
+                                        for name in depends_on]
+            if inputs is not None:
+                fields["inputs"] = list(inputs)
+            if outputs is not None:
+                fields["outputs"] = list(outputs)
+            updated = dict(self.registry.get(script_id), **fields)
+            PipelineGraph([updated if script["id"] == script_id else script for script in self.registry.all()])
+            script = dict(self.registry.update(script_id, **fields))
+            self._graph = None
+        self.events.publish("scripts_changed", changed=[script], removed=[])
+        return script
+
+    def pipeline(self):
+        """Return the scripts in dependency order with their upstream and downstream ids and step status."""
+        with self._lock:
+            graph = self._pipeline_graph()
+            steps = []
+            for script_id in graph.order:
+                script = self.registry.get(script_id)
+                steps.append({"id": script_id, "file_path": script["file_path"],
+                              "upstream": sorted(graph.upstream[script_id]),
+                              "downstream": sorted(graph.downstream[script_id]),
+                              "last_status": script.get("last_status"), "last_success": script.get("last_success")})
+            return {"steps": steps, "error": self._graph_error}
+
+    def rerun_failed(self):
+        """Run every script whose last run failed; the steps blocked behind them follow as they succeed."""
+        with self._lock:
+            failed = [script["id"] for script in self.registry.all() if script.get("last_status") == "failed"]
+        return [run for run in (self.run_script(script_id) for script_id in failed) if run is not None]
+
+    def _pipeline_graph(self):
+        """Caller holds the lock."""
+        if self._graph is None:
+            try:
+                self._graph = PipelineGraph(self.registry.all())
+                self._graph_error = None
+            except ValueError as e:
+                self._graph = PipelineGraph([])  # Chain nothing until the cycle is fixed
+                self._graph_error = str(e)
+        return self._graph
+
+    def _step_hash(self, script):
+        """Hash of the script and its inputs, or None if it declares no inputs (and so is never skipped)."""
+        if not script.get("inputs"):
+            return None
+        try:
+            return self.hasher.step_hash(script)
+        except OSError:
+            return None
+
+    def _run_steps(self):
+        while True:
+            item = self._steps.get()
+            try:
+                if item is None:
+                    return
+                function, args = item
+                try:
+                    function(*args)
+                except KeyError:
+                    pass  # Script removed meanwhile
+                except Exception:
+                    traceback.print_exc()
+            finally:
+                self._steps.task_done()
+
+    def _fire_step(self, script_id, scheduled_for):
+        """Start a scheduled step, unless some upstream step has not succeeded since it last started."""
+        with self._lock:
+            due = self._is_due(self._pipeline_graph(), script_id)
+            file_path = self.registry.get(script_id)["file_path"]
+        if not due:
+            now = datetime.now()
+            self.history.record(file_path, now, "blocked", scheduled_at=scheduled_for, finished_at=now)
+            self.metrics.observe(file_path, "blocked")
+            self.events.publish("step_blocked", file_path=file_path)
+            return
+        if self._start_step(script_id, scheduled_for=scheduled_for):
+            self._advance_pipeline(script_id)
+
+    def _start_step(self, script_id, scheduled_for=None):
+        """Run the script, unless its script and inputs are unchanged since its last successful run and its
+        outputs are all still there. Returns True if it was skipped as up to date."""
+        script = self.registry.get(script_id)
+        step_hash = self._step_hash(script)
+        if (step_hash is None or step_hash != script.get("input_hash")
+                or not all(os.path.exists(path) for path in script.get("outputs") or ())):
+            self._submit(script, scheduled_for, step_hash)
+            return False
+        now = datetime.now()
+        with self._lock:
+            script = dict(self.registry.update(script_id, last_status="cached", last_attempt=now.isoformat(),
+                                               last_success=now.isoformat()))
+        self.history.record(script["file_path"], now, "cached", scheduled_at=scheduled_for, finished_at=now)
+        self.metrics.observe(script["file_path"], "cached")
+        self.events.publish("scripts_changed", changed=[script], removed=[])
+        self.events.publish("step_cached", file_path=script["file_path"])
+        return True
+
+    def _finish_step(self, run):
+        """Record a run's outcome for its pipeline: start the steps downstream of it if it succeeded,
+        mark them blocked if not."""
+        succeeded = run.status == "finished" and run.returncode == 0
+        with self._lock:
+            step_hash = self._run_hashes.pop(run.run_id, None)
+            script = self.registry.find_by_path(run.file_path)
+            if script is None:
+                return
+            fields = {"last_status": "succeeded" if succeeded else "failed"}
+            if succeeded:
+                fields.update(last_success=run.finished_at.isoformat(), input_hash=step_hash)
+            changed = [dict(self.registry.update(script["id"], **fields))]
+            if not succeeded:
+                for script_id in sorted(self._pipeline_graph().descendants(script["id"])):
+                    changed.append(dict(self.registry.update(script_id, last_status="blocked")))
+        self.events.publish("scripts_changed", changed=changed, removed=[])
+        if succeeded:
+            # Upstream steps that succeeded while it ran make the script itself due again
+            self._steps.put((self._advance_pipeline, (script["id"], True)))
+
+    def _advance_pipeline(self, script_id, include_self=False):
+        """Start the steps downstream of a script that succeeded, once all of their upstream steps have
+        succeeded since they were last started. Steps skipped as up to date pass it on in turn."""
+        pending = deque([(script_id, include_self)])
+        while pending:
+            succeeded_id, check_self = pending.popleft()
+            with self._lock:
+                graph = self._pipeline_graph()
+                candidates = sorted(graph.downstream.get(succeeded_id, ()))
+                if check_self and graph.upstream.get(succeeded_id):
+                    candidates.append(succeeded_id)
+                ready = [candidate for candidate in candidates if self._is_due(graph, candidate)]
+            for candidate in ready:
+                try:
+                    if self._start_step(candidate):
+                        pending.append((candidate, False))
+                except KeyError:
+                    continue  # Removed meanwhile
+
+    def _is_due(self, graph, script_id):
+        """Caller holds the lock."""
+        started = self.registry.get(script_id).get("last_attempt") or ""
+        return all((self.registry.get(upstream_id).get("last_success") or "") > started
+                   for upstream_id in graph.upstream.get(script_id, ()))
+
+    # Metrics
+
+    def stats(self):
+        """Per-script run statistics and recent alerts."""
+        return {"scripts": self.metrics.summary(), "alerts": self.metrics.alerts(), "engine": self.engine.stats()}
+
+    def metrics_text(self):
+        """The metrics in the Prometheus text format."""
+        return self.metrics.prometheus(self._metric_gauges())
+
+    def _metric_gauges(self):
+        engine = self.engine.stats()
+        return {"workers": engine["workers"], "running_runs": engine["running"], "queued_runs": engine["queued"],
+                "scheduled_jobs": len(self.timer.jobs())}
+
+    def _export_metrics(self):
+        exported = None
+        while not self._stopping.wait(METRICS_EXPORT_INTERVAL):
+            exported = self._write_metrics(exported)
+
+    def _write_metrics(self, exported=None):
+        """Rewrite the metrics file if the metrics changed since version `exported`. Returns the version written."""
+        version = self.metrics.version
+        if METRICS_FILE and version != exported:
+            try:
+                self.metrics.write_textfile(METRICS_FILE, self._metric_gauges())
+            except OSError:
+                return exported  # Try again next time
+        return version
+
+    # Status
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "scheduler_running": self.timer.running,
+            "scripts": len(self.registry),
+            "jobs": len(self.timer.jobs()),
+            "engine": self.engine.stats(),
+            "mode_stats": self.engine.mode_stats(),
+            "last_event": self.events.last_seq,
+        }
+
+    def shutdown(self, kill=False):
+        self._stopping.set()
+        self._output.pending.set()  # Wake the output pump so it can exit
+        self.timer.stop()
+        self._steps.put(None)
+        self._step_thread.join()
+        self.engine.shutdown(kill=kill)
+        self.registry.save()
+        self._write_metrics()
+        self.history.close()
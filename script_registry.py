@@ -0,0 +1,210 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+SAVE_DELAY = 0.5  # Seconds to gather further changes before writing the file
+
+
+def new_script_id():
+    return uuid.uuid4().hex[:12]
+
+
+class ScriptRegistry:
+    """Registered scripts keyed by a stable id, persisted to a JSON file.
+
+    Lookups by id or file path are O(1). Changes are written atomically (temporary file, then
+    rename) after a short delay, so a burst of changes costs a single write. The file is still
+    the list of script dictionaries it always was, each now carrying an "id".
+
+    Other programs may edit the file too. Changes made here are tracked field by field until they
+    are saved, and both reading and writing merge them over the file's current contents, so
+    neither side's edits are lost.
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self._scripts = {}  # id -> script dictionary, in registration order
+        self._by_path = {}  # file_path -> id
+        self._lock = threading.RLock()
+        self._save_timer = None
+        self._file_state = None  # (mtime_ns, size) of the file as last read or written
+        # Changes not saved yet: id -> names of the fields changed here, plus ids added and removed here
+        self._dirty = {}
+        self._added = set()
+        self._removed = set()
+        # Outside edits merged in but not yet returned by load() or reload_if_changed()
+        self._outside_changed = set()
+        self._outside_removed = set()
+        self.load()
+
+    def load(self):
+        """Read the file, keeping changes made here that are not saved yet. Returns (changed scripts, removed ids)
+        for everything other programs changed since the last load."""
+        with self._lock:
+            if self._merge_file():
+                self.save()  # Persist the ids given to scripts that had none
+            return self._take_outside_changes()
+
+    def reload_if_changed(self):
+        """Reload if something else modified the file. Returns (changed, removed), or None if it was unchanged."""
+        with self._lock:
+            if self._stat() != self._file_state:
+                try:
+                    self._merge_file()
+                except (OSError, ValueError):
+                    pass  # Half-written by another program; try again on the next check
+            if not self._outside_changed and not self._outside_removed:
+                return None
+            return self._take_outside_changes()
+
+    def _merge_file(self):
+        """Replace the registry with the file's contents plus the unsaved changes made here, field by field.
+        Caller holds the lock. Returns True if some scripts in the file had no id yet."""
+        state = self._stat()
+        scripts = []
+        if state is not None:
+            with open(self.path, "r") as file:
+                scripts = json.load(file)
+        missing_ids = False
+        loaded = {}
+        for script in scripts:
+            if not script.get("id"):
+                script["id"] = new_script_id()
+                missing_ids = True
+            loaded[script["id"]] = script
+        for script_id in self._removed:
+            loaded.pop(script_id, None)
+        paths = {script["file_path"] for script in loaded.values()}
+        for script_id, fields in self._dirty.items():
+            script = self._scripts.get(script_id)
+            if script is None:
+                continue  # Removed by another program since
+            if script_id in loaded:
+                loaded[script_id].update((field, script[field]) for field in fields if field in script)
+            elif script_id in self._added and script["file_path"] not in paths:
+                loaded[script_id] = script  # Registered here and not saved yet; an outside removal drops the rest
+        changed = {script_id for script_id, script in loaded.items() if self._scripts.get(script_id) != script}
+        self._outside_changed.update(changed)
+        removed = {script_id for script_id in self._scripts if script_id not in loaded}
+        self._outside_changed -= removed
+        self._outside_removed.update(removed)
+        self._outside_removed -= set(loaded)
+        self._scripts = loaded
+        self._by_path = {script["file_path"]: script_id for script_id, script in loaded.items()}
+        self._file_state = state
+        return missing_ids
+
+    def _take_outside_changes(self):
+        """Caller holds the lock."""
+        changed = [self._scripts[script_id] for script_id in self._scripts if script_id in self._outside_changed]
+        removed = sorted(self._outside_removed)
+        self._outside_changed.clear()
+        self._outside_removed.clear()
+        return changed, removed
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __len__(self):
+        return len(self._scripts)
+
+    def __contains__(self, script_id):
+        return script_id in self._scripts
+
+    def get(self, script_id):
+        """Return the script with this id; raises KeyError if there is none."""
+        with self._lock:
+            script = self._scripts.get(script_id)
+            if script is None:
+                raise KeyError(f"Unknown script: {script_id}")
+            return script
+
+    def find_by_path(self, file_path):
+        with self._lock:
+            script_id = self._by_path.get(file_path)
+            return self._scripts[script_id] if script_id is not None else None
+
+    def all(self):
+        with self._lock:
+            return list(self._scripts.values())
+
+    def add(self, file_path, **fields):
+        """Register a script and return it, or return None if the file is already registered."""
+        with self._lock:
+            if file_path in self._by_path:
+                return None
+            script = {"id": new_script_id(), "file_path": file_path, "time": None}
+            script.update(fields)
+            self._scripts[script["id"]] = script
+            self._by_path[file_path] = script["id"]
+            self._added.add(script["id"])
+            self._dirty[script["id"]] = set(script)
+            self.schedule_save()
+            return script
+
+    def update(self, script_id, **fields):
+        with self._lock:
+            script = self.get(script_id)
+            script.update(fields)
+            self._dirty.setdefault(script_id, set()).update(fields)
+            self.schedule_save()
+            return script
+
+    def remove(self, script_id):
+        with self._lock:
+            script = self._scripts.pop(script_id, None)
+            if script is None:
+                raise KeyError(f"Unknown script: {script_id}")
+            del self._by_path[script["file_path"]]
+            self._dirty.pop(script_id, None)
+            if script_id in self._added:
+                self._added.discard(script_id)
+            else:
+                self._removed.add(script_id)
+            self.schedule_save()
+            return script
+
+    def schedule_save(self):
+        """Write the file after save_delay, folding in any further changes made meanwhile."""
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        """Write the registry to the file now, atomically, after merging in any edits other programs made."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._stat() != self._file_state:
+                try:
+                    self._merge_file()
+                except (OSError, ValueError):
+                    pass  # Half-written by another program; the complete registry written here wins
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, temp_path = tempfile.mkstemp(prefix=".scripts-", suffix=".json", dir=directory)
+            try:
+                if os.path.exists(self.path):
+                    os.chmod(temp_path, os.stat(self.path).st_mode & 0o777)  # mkstemp creates it private
+                with os.fdopen(fd, "w") as file:
+                    json.dump(list(self._scripts.values()), file)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            self._file_state = self._stat()
+            self._dirty.clear()
+            self._added.clear()
+            self._removed.clear()
@@ -0,0 +1,124 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from executor import OVERLAP_QUEUE, OVERLAP_SKIP, ExecutionEngine
+
+WAIT = 30  # Seconds a test waits for a run before giving up
+
+
+class ExecutionEngineTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.engines = []
+        self.started = []  # file names, in start order
+        self._lock = threading.Lock()
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.shutdown(kill=True)
+        self._dir.cleanup()
+
+    def _script(self, name, body="pass\n"):
+        path = os.path.join(self._dir.name, name)
+        with open(path, "w") as file:
+            file.write(body)
+        return path
+
+    def _record_start(self, run):
+        with self._lock:
+            self.started.append(os.path.basename(run.file_path))
+
+    def _engine(self, **options):
+        options.setdefault("on_start", self._record_start)
+        engine = ExecutionEngine(python=sys.executable, log_dir=os.path.join(self._dir.name, "logs"), **options)
+        self.engines.append(engine)
+        return engine
+
+    def _wait(self, *runs):
+        for run in runs:
+            self.assertTrue(run.done.wait(WAIT), f"Run of {run.file_path} did not finish")
+
+    def test_runs_dispatch_by_priority(self):
+        engine = self._engine(max_workers=1)
+        release = self._script("release")
+        blocker = engine.submit(self._script("blocker.py", f"import os, time\n"
+                                                          f"while not os.path.exists({release!r}):\n"
+                                                          f"    time.sleep(0.01)\n"))
+        runs = [engine.submit(self._script(f"p{priority}.py"), priority=priority) for priority in (5, 1, 3)]
+        open(release, "w").close()
+        self._wait(blocker, *runs)
+        self.assertEqual(self.started, ["blocker.py", "p1.py", "p3.py", "p5.py"])
+
+    def test_per_script_limit_queues_extra_runs(self):
+        engine = self._engine(max_workers=3, overlap=OVERLAP_QUEUE)
+        path = self._script("limited.py", "import time\ntime.sleep(0.2)\n")
+        runs = [engine.submit(path) for _ in range(3)]
+        self._wait(*runs)
+        spans = sorted((run.started_at, run.finished_at) for run in runs)
+        for (_, finished), (started, _) in zip(spans, spans[1:]):
+            self.assertGreaterEqual(started, finished)
+        self.assertFalse(engine.is_busy(path))
+
+    def test_raised_script_limit_releases_blocked_runs(self):
+        engine = self._engine(max_workers=2, overlap=OVERLAP_QUEUE)
+        path = self._script("limited.py", "import time\ntime.sleep(0.5)\n")
+        engine.set_script_limit(path, 2)
+        runs = [engine.submit(path) for _ in range(2)]
+        self._wait(*runs)
+        self.assertLess(max(run.started_at for run in runs), min(run.finished_at for run in runs))
+
+    def test_overlap_skip_and_queue(self):
+        engine = self._engine(max_workers=1, overlap=OVERLAP_SKIP)
+        path = self._script("busy.py", "import time\ntime.sleep(0.3)\n")
+        first = engine.submit(path)
+        self.assertIsNone(engine.submit(path))
+        queued = engine.submit(path, overlap=OVERLAP_QUEUE)
+        self.assertIsNotNone(queued)
+        self._wait(first, queued)
+        self.assertEqual([first.status, queued.status], ["finished", "finished"])
+
+    def test_timeout_kills_the_run(self):
+        engine = self._engine(max_workers=1)
+        run = engine.submit(self._script("slow.py", "import time\ntime.sleep(30)\n"), timeout=0.5)
+        self._wait(run)
+        self.assertEqual(run.status, "timed out")
+        self.assertNotEqual(run.returncode, 0)
+        self.assertLess(run.duration, 10)
+
+    def test_exit_code_and_output_are_captured(self):
+        engine = self._engine(max_workers=1)
+        run = engine.submit(self._script("fails.py", "import sys\nprint('partial')\nsys.exit(3)\n"))
+        self._wait(run)
+        self.assertEqual((run.status, run.returncode, run.stdout), ("failed", 3, "partial"))
+
+    def test_launch_failure(self):
+        engine = ExecutionEngine(max_workers=1, python=os.path.join(self._dir.name, "no-such-python"),
+                                 log_dir=os.path.join(self._dir.name, "logs"))
+        self.engines.append(engine)
+        run = engine.submit(self._script("ok.py"))
+        self._wait(run)
+        self.assertEqual(run.status, "launch failed")
+        self.assertIsInstance(run.error, OSError)
+
+    def test_raising_callbacks_do_not_kill_workers(self):
+        def fail(run):
+            raise ValueError("bad callback")
+
+        engine = self._engine(max_workers=2, overlap=OVERLAP_QUEUE, on_start=fail, on_complete=fail)
+        path = self._script("ok.py")
+        logged = threading.Semaphore(0)
+        with mock.patch("executor.traceback.print_exc", side_effect=logged.release):
+            runs = [engine.submit(path) for _ in range(6)]
+            self._wait(*runs)
+            for _ in range(2 * len(runs)):  # One traceback per callback
+                self.assertTrue(logged.acquire(timeout=WAIT))
+        self.assertEqual({run.status for run in runs}, {"finished"})
+        self.assertTrue(all(worker.is_alive() for worker in engine._workers))
+
+
+if __name__ == "__main__":
+    unittest.main()
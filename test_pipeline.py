@@ -0,0 +1,173 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import scheduler_core
+from pipeline import PipelineGraph, StepHasher
+from run_history import RunHistory
+
+
+class PipelineGraphTest(unittest.TestCase):
+    def test_order_follows_dependencies(self):
+        graph = PipelineGraph([{"id": "c", "depends_on": ["b"]}, {"id": "b", "depends_on": ["a"]}, {"id": "a"}])
+        self.assertEqual(graph.order, ["a", "b", "c"])
+        self.assertEqual(graph.descendants("a"), {"b", "c"})
+
+    def test_script_reading_an_output_runs_after_its_producer(self):
+        graph = PipelineGraph([{"id": "consumer", "inputs": [os.path.abspath("data/out.csv")]},
+                               {"id": "producer", "outputs": ["data/../data/out.csv"]}])
+        self.assertEqual(graph.upstream["consumer"], {"producer"})
+        self.assertEqual(graph.downstream["producer"], {"consumer"})
+
+    def test_unknown_dependencies_and_self_edges_are_ignored(self):
+        graph = PipelineGraph([{"id": "a", "depends_on": ["gone", "a"], "inputs": ["x"], "outputs": ["x"]}])
+        self.assertEqual(graph.upstream["a"], set())
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            PipelineGraph([{"id": "a", "depends_on": ["b"]}, {"id": "b", "depends_on": ["a"]}])
+        with self.assertRaises(ValueError):
+            PipelineGraph([{"id": "a", "inputs": ["y"], "outputs": ["x"]},
+                           {"id": "b", "inputs": ["x"], "outputs": ["y"]}])
+
+
+class StepHasherTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.script = {"file_path": self._write("step.py", "pass\n"), "inputs": [self._write("in.txt", "1")]}
+        self.hasher = StepHasher()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, name, text):
+        path = os.path.join(self._dir.name, name)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def test_hash_follows_the_inputs(self):
+        before = self.hasher.step_hash(self.script)
+        self.assertEqual(self.hasher.step_hash(self.script), before)
+        self._write("in.txt", "22")
+        self.assertNotEqual(self.hasher.step_hash(self.script), before)
+
+    def test_unchanged_files_are_not_read_again(self):
+        self.hasher.step_hash(self.script)
+        with mock.patch("pipeline.open", create=True, side_effect=open) as opened:
+            self.hasher.step_hash(self.script)
+        self.assertFalse(opened.called)
+
+    def test_missing_input(self):
+        self.assertIsNone(self.hasher.file_digest(os.path.join(self._dir.name, "missing.txt")))
+
+
+class PipelineCoreTest(unittest.TestCase):
+    """The diamond a -> (b, c) -> d, with runs submitted to a stub instead of the engine."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.TemporaryDirectory()
+        os.chdir(self._dir.name)
+        self.core = scheduler_core.SchedulerCore("scripts.json", RunHistory("run_history.db"))
+        self.core.timer.clear()
+        self.ids = {name: self.core.add_script(os.path.abspath(f"{name}.py"))["id"] for name in "abcd"}
+        self.core.set_pipeline(self.ids["b"], depends_on=[self.ids["a"]])
+        self.core.set_pipeline(self.ids["c"], depends_on=[self.ids["a"]])
+        self.core.set_pipeline(self.ids["d"], depends_on=[self.ids["b"], self.ids["c"]])
+        self.submitted = []
+        self.core._submit = self._submit
+
+    def tearDown(self):
+        self.core.shutdown()
+        self.core.timer.clear()
+        os.chdir(self._cwd)
+        self._dir.cleanup()
+
+    def _submit(self, script, scheduled_for, step_hash):
+        self.submitted.append(script["id"])
+        self.core.registry.update(script["id"], last_attempt=datetime.now().isoformat())
+
+    def _finish(self, name, succeeded=True):
+        time.sleep(0.001)  # Finishes strictly after the attempt it ends
+        script = self.core.registry.get(self.ids[name])
+        run = SimpleNamespace(run_id=name, file_path=script["file_path"], status="finished" if succeeded else "failed",
+                              returncode=0 if succeeded else 1, finished_at=datetime.now())
+        self.core._finish_step(run)
+        self.core._steps.join()
+
+    def _started(self):
+        started = [name for name in "abcd" if self.ids[name] in self.submitted]
+        self.submitted.clear()
+        return started
+
+    def _fire(self, name):
+        job = SimpleNamespace(job_id=self.ids[name], next_fire=datetime.now())
+        self.core._on_job_due(job, datetime.now())
+        self.core._steps.join()
+
+    def test_join_waits_for_both_branches(self):
+        self._fire("a")
+        self.assertEqual(self._started(), ["a"])
+        self._finish("a")
+        self.assertEqual(self._started(), ["b", "c"])
+        self._finish("b")
+        self.assertEqual(self._started(), [])
+        self._finish("c")
+        self.assertEqual(self._started(), ["d"])
+
+    def test_failure_blocks_everything_downstream(self):
+        self._fire("a")
+        self._finish("a", succeeded=False)
+        self.assertEqual(self._started(), ["a"])
+        statuses = {name: self.core.registry.get(self.ids[name])["last_status"] for name in "abcd"}
+        self.assertEqual(statuses, {"a": "failed", "b": "blocked", "c": "blocked", "d": "blocked"})
+
+    def test_scheduled_fire_of_a_blocked_step_does_not_run(self):
+        self._fire("a")
+        self._finish("a")
+        self._finish("b")
+        self._started()
+        self._fire("d")  # c has not succeeded yet
+        self.assertEqual(self._started(), [])
+        self.core.history.flush()
+        self.assertEqual([run["script"] for run in self.core.history.page(status="blocked")],
+                         [os.path.abspath("d.py")])
+        self._finish("c")
+        self.assertEqual(self._started(), ["d"])
+
+    def test_unchanged_step_is_cached(self):
+        with open("in.txt", "w") as file:
+            file.write("1")
+        with open("a.py", "w") as file:
+            file.write("pass\n")
+        self.core.set_pipeline(self.ids["a"], inputs=["in.txt"])
+        self._fire("a")
+        self.assertEqual(self._started(), ["a"])
+        self.core._run_hashes["a"] = self.core._step_hash(self.core.registry.get(self.ids["a"]))
+        self._finish("a")
+        self._started()
+        self._fire("a")
+        self.assertEqual(self._started(), ["b", "c"])  # A cached step passes the pipeline on like a successful one
+        self.assertEqual(self.core.registry.get(self.ids["a"])["last_status"], "cached")
+        with open("in.txt", "w") as file:
+            file.write("22")
+        self._fire("a")
+        self.assertEqual(self._started(), ["a"])
+
+    def test_steps_are_hashed_off_the_timer_thread(self):
+        self.core.set_pipeline(self.ids["a"], inputs=["in.txt"])
+        threads = []
+        with mock.patch.object(self.core.hasher, "step_hash",
+                               side_effect=lambda script: threads.append(threading.current_thread().name)):
+            self._fire("a")
+        self.assertEqual(threads, ["pipeline-steps"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from script_registry import ScriptRegistry
+
+
+class ScriptRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "scripts.json")
+        self.registry = ScriptRegistry(self.path, save_delay=60)  # Tests save explicitly
+
+    def tearDown(self):
+        self.registry.save()  # Cancels the pending save timer
+        self._dir.cleanup()
+
+    def _read(self):
+        with open(self.path) as file:
+            return json.load(file)
+
+    def _edit(self, edit):
+        """Rewrite the file as another program would, making sure its mtime moves."""
+        scripts = self._read()
+        edit(scripts)
+        time.sleep(0.01)
+        with open(self.path, "w") as file:
+            json.dump(scripts, file)
+
+    def test_lookup_by_id_and_path(self):
+        script = self.registry.add("/jobs/a.py", time="06:00")
+        self.assertIsNone(self.registry.add("/jobs/a.py"))
+        self.assertIs(self.registry.get(script["id"]), script)
+        self.assertIs(self.registry.find_by_path("/jobs/a.py"), script)
+        self.registry.remove(script["id"])
+        self.assertIsNone(self.registry.find_by_path("/jobs/a.py"))
+        with self.assertRaises(KeyError):
+            self.registry.get(script["id"])
+
+    def test_save_is_atomic_and_round_trips(self):
+        script = self.registry.add("/jobs/a.py", time="06:00")
+        self.registry.save()
+        self.assertEqual(os.listdir(self._dir.name), ["scripts.json"])  # No temporary file left behind
+        self.assertEqual(ScriptRegistry(self.path).get(script["id"]), script)
+
+    def test_scripts_without_ids_get_them(self):
+        with open(self.path, "w") as file:
+            json.dump([{"file_path": "/jobs/old.py", "time": None}], file)
+        registry = ScriptRegistry(self.path)
+        self.assertTrue(self._read()[0]["id"])
+        self.assertEqual(registry.find_by_path("/jobs/old.py")["id"], self._read()[0]["id"])
+
+    def test_reload_reports_outside_changes(self):
+        kept = self.registry.add("/jobs/a.py", time="06:00")
+        dropped = self.registry.add("/jobs/b.py")
+        self.registry.save()
+        self.assertIsNone(self.registry.reload_if_changed())
+
+        def edit(scripts):
+            scripts[0]["time"] = "07:00"
+            del scripts[1]
+            scripts.append({"file_path": "/jobs/c.py", "time": None})
+        self._edit(edit)
+        changed, removed = self.registry.reload_if_changed()
+        self.assertEqual(sorted(script["file_path"] for script in changed), ["/jobs/a.py", "/jobs/c.py"])
+        self.assertEqual(removed, [dropped["id"]])
+        self.assertEqual(self.registry.get(kept["id"])["time"], "07:00")
+        self.assertIsNone(self.registry.reload_if_changed())
+
+    def test_save_keeps_outside_edits(self):
+        script = self.registry.add("/jobs/a.py", time="06:00")
+        self.registry.save()
+        self.registry.update(script["id"], last_status="succeeded")
+
+        def edit(scripts):
+            scripts[0]["time"] = "07:00"
+            scripts.append({"id": "outside", "file_path": "/jobs/b.py", "time": None})
+        self._edit(edit)
+        self.registry.save()  # As the debounce timer would, before the watcher noticed the edit
+        saved = {entry["file_path"]: entry for entry in self._read()}
+        self.assertEqual(saved["/jobs/a.py"]["time"], "07:00")
+        self.assertEqual(saved["/jobs/a.py"]["last_status"], "succeeded")
+        self.assertIn("/jobs/b.py", saved)
+        changed, removed = self.registry.reload_if_changed()  # The watcher still hears about the edit
+        self.assertEqual(sorted(entry["file_path"] for entry in changed), ["/jobs/a.py", "/jobs/b.py"])
+
+    def test_reload_keeps_unsaved_changes(self):
+        script = self.registry.add("/jobs/a.py", time="06:00")
+        self.registry.save()
+        self.registry.update(script["id"], last_status="failed")
+        added = self.registry.add("/jobs/new.py")
+        self._edit(lambda scripts: scripts[0].update(time="07:00"))
+        self.registry.reload_if_changed()
+        self.assertEqual(self.registry.get(script["id"])["last_status"], "failed")
+        self.assertEqual(self.registry.get(script["id"])["time"], "07:00")
+        self.assertIs(self.registry.find_by_path("/jobs/new.py"), added)
+
+    def test_unsaved_removal_survives_reload(self):
+        first = self.registry.add("/jobs/a.py")
+        second = self.registry.add("/jobs/b.py")
+        self.registry.save()
+        self.registry.remove(first["id"])
+        self._edit(lambda scripts: scripts[1].update(time="07:00"))
+        self.registry.reload_if_changed()
+        self.assertNotIn(first["id"], self.registry)
+        self.assertEqual(self.registry.get(second["id"])["time"], "07:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
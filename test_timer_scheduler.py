@@ -0,0 +1,140 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+
+import scheduler_core
+from run_history import RunHistory
+from timer_scheduler import (MISFIRE_RUN_ALL, MISFIRE_RUN_ONCE, MISFIRE_SKIP, DailyTrigger, IntervalTrigger,
+                             TimerScheduler, parse_trigger)
+
+
+def _noop(job, scheduled_time):
+    pass
+
+
+class TriggerTest(unittest.TestCase):
+    def test_daily_fires_later_today_or_tomorrow(self):
+        trigger = DailyTrigger("06:30")
+        self.assertEqual(trigger.next_after(datetime(2024, 3, 1, 5, 0)), datetime(2024, 3, 1, 6, 30))
+        self.assertEqual(trigger.next_after(datetime(2024, 3, 1, 6, 30)), datetime(2024, 3, 2, 6, 30))
+
+    def test_interval_counts_from_start(self):
+        trigger = IntervalTrigger(600, start=datetime(2024, 3, 1, 12, 0))
+        self.assertEqual(trigger.next_after(datetime(2024, 3, 1, 12, 25)), datetime(2024, 3, 1, 12, 30))
+
+    def test_cron_day_fields_match_either(self):
+        trigger = parse_trigger("0 9 1 * 1")  # The 1st of the month, or a Monday
+        self.assertEqual(trigger.next_after(datetime(2024, 3, 1, 10, 0)), datetime(2024, 3, 4, 9, 0))
+
+    def test_cron_starred_weekday_step_leaves_day_to_day_of_month(self):
+        trigger = parse_trigger("30 2 1 * */2")  # Only on the 1st, as in cron
+        self.assertEqual(trigger.next_after(datetime(2024, 3, 1, 3, 0)), datetime(2024, 4, 1, 2, 30))
+
+    def test_cron_date_that_never_occurs(self):
+        with self.assertRaises(ValueError):
+            parse_trigger("0 0 31 2 *")
+        self.assertEqual(parse_trigger("0 0 29 2 *").next_after(datetime(2024, 3, 1)), datetime(2028, 2, 29))
+
+    def test_unrecognised_spec(self):
+        with self.assertRaises(ValueError):
+            parse_trigger("tomorrow-ish")
+
+
+class MisfireTest(unittest.TestCase):
+    def setUp(self):
+        self.timer = TimerScheduler()
+        self.trigger = IntervalTrigger(3600)
+
+    def _due(self, misfire, hours_ago):
+        job = self.timer.add_job("job", self.trigger, _noop, misfire=misfire,
+                                 last_run=datetime.now() - timedelta(hours=hours_ago, minutes=30))
+        return self.timer._take_due_runs(job)
+
+    def test_without_last_run_first_fire_is_after_now(self):
+        job = self.timer.add_job("job", self.trigger, _noop)
+        self.assertGreater(job.next_fire, datetime.now())
+
+    def test_run_once_catches_up_once(self):
+        self.assertEqual(len(self._due(MISFIRE_RUN_ONCE, 3)), 1)
+
+    def test_run_all_catches_up_every_missed_fire(self):
+        self.assertEqual(len(self._due(MISFIRE_RUN_ALL, 3)), 3)
+
+    def test_skip_drops_missed_fires(self):
+        self.assertEqual(self._due(MISFIRE_SKIP, 3), [])
+        self.assertGreater(self.timer.get_job("job").next_fire, datetime.now())
+
+    def test_one_shot_in_the_past_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.timer.add_job("job", parse_trigger("2020-01-01 10:00"), _noop)
+        self.assertIsNone(self.timer.get_job("job"))
+
+    def test_failing_callback_is_logged_and_the_timer_keeps_running(self):
+        def fail(job, scheduled_time):
+            raise RuntimeError("engine shut down")
+
+        fired = threading.Event()
+        self.timer.add_job("failing", IntervalTrigger(0.05), fail)
+        self.timer.add_job("next", IntervalTrigger(0.2), lambda job, scheduled_time: fired.set())
+        with mock.patch("timer_scheduler.traceback.print_exc") as print_exc:
+            self.timer.start()
+            try:
+                self.assertTrue(fired.wait(5))
+            finally:
+                self.timer.stop()
+        self.assertTrue(print_exc.called)
+
+    def test_replacing_jobs_does_not_grow_the_heap(self):
+        for _ in range(1000):
+            self.timer.add_job("job", self.trigger, _noop)
+        self.assertLess(len(self.timer._heap), 100)
+
+
+class RescheduleTest(unittest.TestCase):
+    """Rescheduling a script that ran before must not look like a missed run."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._dir = tempfile.TemporaryDirectory()
+        os.chdir(self._dir.name)
+        self.core = scheduler_core.SchedulerCore("scripts.json", RunHistory("run_history.db"))
+        self.core.timer.clear()
+        script = self.core.add_script(os.path.abspath("job.py"))
+        self.script_id = script["id"]
+        last_run = datetime.now() - timedelta(days=3)
+        self.core.registry.update(self.script_id, last_run=last_run.isoformat(timespec="seconds"))
+        self.later = (datetime.now() + timedelta(hours=2)).strftime("%H:%M")
+
+    def tearDown(self):
+        self.core.shutdown()
+        self.core.timer.clear()
+        os.chdir(self._cwd)
+        self._dir.cleanup()
+
+    def test_schedule_counts_from_now(self):
+        self.core.schedule_script(self.script_id, self.later)
+        self.assertGreater(self.core.timer.get_job(self.script_id).next_fire, datetime.now())
+
+    def test_schedule_in_the_past_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.core.schedule_script(self.script_id, "2020-01-01 10:00")
+        self.assertFalse(self.core.registry.get(self.script_id).get("scheduled"))
+        self.assertIsNone(self.core.timer.get_job(self.script_id))
+
+    def test_restore_unschedules_one_shots_that_have_passed(self):
+        self.core.registry.update(self.script_id, time="2020-01-01 10:00", scheduled=True, last_run=None)
+        self.core.restore_jobs()
+        self.assertFalse(self.core.registry.get(self.script_id)["scheduled"])
+
+    def test_restore_catches_up_from_last_run(self):
+        self.core.schedule_script(self.script_id, self.later)
+        self.core.timer.clear()
+        self.core.restore_jobs()
+        self.assertLess(self.core.timer.get_job(self.script_id).next_fire, datetime.now())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,343 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+# Misfire policies: what to do with fire times missed while the process was down or the machine asleep
+MISFIRE_SKIP = "skip"  # Drop the missed runs and wait for the next fire time
+MISFIRE_RUN_ONCE = "run_once"  # Run once to catch up, however many fire times were missed
+MISFIRE_RUN_ALL = "run_all"  # Run once for every missed fire time, up to MAX_CATCH_UP_RUNS
+
+MISFIRE_GRACE_SECONDS = 60  # A run this late still counts as on time
+MAX_CATCH_UP_RUNS = 100
+MAX_SLEEP_SECONDS = 300  # Re-check at least this often in case the wall clock jumps
+
+
+class DailyTrigger:
+    """Fire every day at HH:MM or HH:MM:SS local time."""
+
+    def __init__(self, at):
+        parts = [int(part) for part in at.split(":")]
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid time of day: {at}")
+        self.time_of_day = datetime.strptime(":".join(f"{part:02d}" for part in parts + [0] * (3 - len(parts))),
+                                             "%H:%M:%S").time()
+        self.spec = at
+
+    def next_after(self, moment):
+        candidate = datetime.combine(moment.date(), self.time_of_day)
+        if candidate <= moment:
+            candidate += timedelta(days=1)
+        return candidate
+
+
+class IntervalTrigger:
+    """Fire every `seconds` seconds, counted from `start` or else from the previous fire time."""
+
+    def __init__(self, seconds, start=None, spec=None):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.seconds = seconds
+        self.start = start
+        self.spec = spec or f"every {seconds}s"
+
+    def next_after(self, moment):
+        if self.start is None:
+            return moment + timedelta(seconds=self.seconds)
+        if moment < self.start:
+            return self.start
+        periods = int((moment - self.start).total_seconds() // self.seconds) + 1
+        return self.start + timedelta(seconds=periods * self.seconds)
+
+
+class OneShotTrigger:
+    """Fire once at a given moment."""
+
+    def __init__(self, when, spec=None):
+        self.when = when
+        self.spec = spec or when.strftime("%Y-%m-%d %H:%M")
+
+    def next_after(self, moment):
+        return self.when if self.when > moment else None
+
+
+class CronTrigger:
+    """Fire on a standard five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept *, numbers, ranges (a-b), lists (a,b) and steps (*/n, a-b/n). Day of week runs
+    from 0 (Sunday) to 6, with 7 also meaning Sunday. As in cron, when both day fields are
+    restricted a day matches if either does.
+    """
+
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    MONTH_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)  # Most days each month can have
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        parsed = [self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+        minutes, hours, self.days, self.months, weekdays = parsed
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, a day field starting with * (e.g. */2) does not restrict the day on its own
+        self.any_day = fields[2].startswith("*")
+        self.any_weekday = fields[4].startswith("*")
+        self.spec = expression
+        if self.any_weekday and not any(day <= self.MONTH_DAYS[month - 1]
+                                        for month in self.months for day in self.days):
+            raise ValueError(f"Cron expression never fires: {expression}")
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            range_part, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if range_part == "*":
+                start, end = low, high
+            elif "-" in range_part:
+                start, end = (int(value) for value in range_part.split("-", 1))
+            else:
+                start = int(range_part)
+                end = high if step > 1 else start
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Invalid cron field: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                month_start = candidate.replace(day=1, hour=0, minute=0)
+                candidate = (month_start + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            else:
+                hour = next((hour for hour in self.hours if hour >= candidate.hour), None)
+                if hour is None:
+                    candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                elif hour > candidate.hour:
+                    candidate = candidate.replace(hour=hour, minute=0)
+                else:
+                    minute = next((minute for minute in self.minutes if minute >= candidate.minute), None)
+                    if minute is not None:
+                        return candidate.replace(minute=minute)
+                    candidate = candidate.replace(minute=0) + timedelta(hours=1)
+        return None
+
+
+INTERVAL_PATTERN = re.compile(r"^every\s+(\d+)\s*([smhd])$", re.IGNORECASE)
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_trigger(spec):
+    """Build a trigger from a schedule string.
+
+    Accepts "HH:MM" (daily), "every 15m" (interval, units s/m/h/d), a five-field cron expression,
+    or "YYYY-MM-DD HH:MM" (one-shot). Raises ValueError for anything else.
+    """
+    spec = spec.strip()
+    match = INTERVAL_PATTERN.match(spec)
+    if match:
+        return IntervalTrigger(int(match.group(1)) * INTERVAL_UNITS[match.group(2).lower()], spec=spec)
+    if re.match(r"^\d{1,2}:\d{2}(:\d{2})?$", spec):
+        return DailyTrigger(spec)
+    if re.match(r"^\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}(:\d{2})?$", spec):
+        return OneShotTrigger(datetime.fromisoformat(spec), spec=spec)
+    if len(spec.split()) == 5:
+        return CronTrigger(spec)
+    raise ValueError(f"Unrecognised schedule: {spec}")
+
+
+class ScheduledJob:
+    """A registered job and its next fire time."""
+
+    def __init__(self, job_id, trigger, callback, misfire, last_run):
+        self.job_id = job_id
+        self.trigger = trigger
+        self.callback = callback  # Called with (job, scheduled_time) on the scheduler thread
+        self.misfire = misfire
+        self.last_run = last_run
+        self.next_fire = None
+        self.version = 0  # Bumped whenever the job's heap entry is superseded
+
+
+class TimerScheduler:
+    """Fire jobs from a min-heap of next-fire times.
+
+    The scheduler thread sleeps on a condition variable until the earliest fire time, so idle cost
+    does not depend on the number of jobs. Adding a job is O(log n); removing or replacing one
+    leaves a stale heap entry that is discarded lazily, and the heap is compacted once they
+    pile up. Use get_scheduler() for the process-wide instance.
+    """
+
+    def __init__(self, misfire_grace=MISFIRE_GRACE_SECONDS):
+        self.misfire_grace = misfire_grace
+        self._cond = threading.Condition()
+        self._heap = []  # (fire timestamp, sequence, job_id, version)
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._thread = None
+        self._stopping = False
+
+    def add_job(self, job_id, trigger, callback, misfire=MISFIRE_RUN_ONCE, last_run=None):
+        """Register or replace a job.
+
+        If last_run is given, fire times between it and now count as missed and are handled by the
+        misfire policy once the scheduler runs; otherwise the job first fires after now, and a
+        trigger that never fires again (a one-shot time in the past) raises ValueError.
+        """
+        next_fire = trigger.next_after(last_run or datetime.now())
+        if next_fire is None:
+            raise ValueError(f"Schedule {trigger.spec} has no fire time after {last_run or 'now'}")
+        with self._cond:
+            old = self._jobs.get(job_id)
+            job = ScheduledJob(job_id, trigger, callback, misfire, last_run)
+            job.next_fire = next_fire
+            self._jobs[job_id] = job
+            if old is not None:
+                job.version = old.version + 1
+                self._compact()
+            self._push(job)
+            self._cond.notify()
+        return job
+
+    def remove_job(self, job_id):
+        with self._cond:
+            job = self._jobs.pop(job_id, None)
+            if job is not None:
+                job.version += 1
+                self._compact()
+            return job
+
+    def clear(self):
+        with self._cond:
+            self._jobs.clear()
+            self._heap.clear()
+            self._cond.notify()
+
+    def get_job(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def start(self):
+        """Start the scheduler thread. Returns False if it is already running."""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="timer-scheduler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _push(self, job):
+        if job.next_fire is not None:
+            heapq.heappush(self._heap, (job.next_fire.timestamp(), next(self._sequence), job.job_id, job.version))
+
+    def _is_current(self, entry):
+        job = self._jobs.get(entry[2])
+        return job is not None and job.version == entry[3]
+
+    def _compact(self):
+        """Rebuild the heap once stale entries outnumber live ones. Caller holds the lock."""
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = None
+                while due is None:
+                    if self._stopping:
+                        return
+                    while self._heap and not self._is_current(self._heap[0]):
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay > 0:
+                        self._cond.wait(min(delay, MAX_SLEEP_SECONDS))
+                        continue
+                    job = self._jobs[heapq.heappop(self._heap)[2]]
+                    due = self._take_due_runs(job)
+            for scheduled_time in due:
+                try:
+                    job.callback(job, scheduled_time)
+                except Exception:
+                    traceback.print_exc()  # A failing callback must not stop the scheduler thread
+
+    def _take_due_runs(self, job):
+        """Work out which fire times to run now, advance the job and re-queue it. Caller holds the lock."""
+        now = datetime.now()
+        missed = [job.next_fire]
+        next_fire = job.trigger.next_after(job.next_fire)
+        while next_fire is not None and next_fire <= now and len(missed) < MAX_CATCH_UP_RUNS:
+            missed.append(next_fire)
+            next_fire = job.trigger.next_after(next_fire)
+        if next_fire is not None and next_fire <= now:
+            next_fire = job.trigger.next_after(now)
+
+        on_time = [moment for moment in missed if (now - moment).total_seconds() <= self.misfire_grace]
+        late = [moment for moment in missed if moment not in on_time]
+        if not late or job.misfire == MISFIRE_RUN_ALL:
+            due = missed
+        elif job.misfire == MISFIRE_RUN_ONCE:
+            due = on_time or late[-1:]
+        else:
+            due = on_time
+
+        if due:
+            job.last_run = due[-1]
+        job.next_fire = next_fire
+        if next_fire is None:
+            del self._jobs[job.job_id]
+        else:
+            self._push(job)
+        return due
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide TimerScheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TimerScheduler()
+        return _scheduler
@@ -0,0 +1,310 @@
+"""Warm interpreter pool: a forkserver per interpreter that runs scripts in forked children.
+
+The server is this same file run under the target interpreter (so it must only import the
+standard library). It imports the preload modules once, then forks a child per run; the child
+points stdout/stderr at pipes handed over by the parent and runs the script with runpy, as
+`python script.py` would. Requires a POSIX system.
+"""
+import importlib
+import itertools
+import json
+import os
+import runpy
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+PRELOAD_MODULES = ["numpy", "pandas"]  # Imported once per pool; modules that fail to import are skipped
+SERVER_START_TIMEOUT = 60  # Seconds to wait for a server to finish preloading
+LAUNCH_TIMEOUT = 10  # Seconds to wait for a server to confirm a fork
+REAP_INTERVAL = 0.05  # Seconds between reaping checks while children are running, should a SIGCHLD wakeup be missed
+MESSAGE_SIZE = 64 * 1024
+
+
+class WarmProcess:
+    """Handle on a script running in a forked child, with the parts of the Popen interface the engine uses."""
+
+    def __init__(self, pool, request_id, stdout, stderr):
+        self.pool = pool
+        self.request_id = request_id
+        self.stdout = stdout
+        self.stderr = stderr
+        self.pid = None
+        self.returncode = None
+        self.rusage = None  # Resource usage of the child, reported by the server on exit
+        self._started = threading.Event()
+        self._exited = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(f"warm:{self.request_id}", timeout)
+        return self.returncode
+
+    def kill(self):
+        """Ask the server to kill the child. The server reaps its children, so it never signals a recycled pid."""
+        if self.pid is not None and not self._exited.is_set():
+            self.pool.kill(self.request_id)
+
+    def _kill_orphan(self):
+        """Kill a child whose server went away. Nothing reaps it for us any more, so this is best effort."""
+        if self.pid is not None and not self._exited.is_set():
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+class WarmPool:
+    """A forkserver running under one interpreter with the preload modules already imported."""
+
+    def __init__(self, python, preload=None):
+        self.python = python
+        self.preload = list(PRELOAD_MODULES if preload is None else preload)
+        self.preloaded = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._sock = None
+        self._ready = threading.Event()
+        self._requests = itertools.count(1)
+        self._pending = {}  # request id -> WarmProcess
+
+    def start(self):
+        """Start the server if it is not running and wait for it to finish preloading."""
+        with self._lock:
+            if self._server is None or self._server.poll() is not None:
+                self._spawn()
+        if not self._ready.wait(SERVER_START_TIMEOUT):
+            self.close()
+            raise RuntimeError(f"Warm pool for {self.python} did not start")
+
+    def _spawn(self):
+        """Start a new server process. Caller holds the lock."""
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._ready.clear()
+        # The server exits when its stdin pipe closes, i.e. when this process goes away
+        self._server = subprocess.Popen([self.python, os.path.abspath(__file__), str(child_sock.fileno())]
+                                        + self.preload, stdin=subprocess.PIPE, pass_fds=(child_sock.fileno(),))
+        child_sock.close()
+        self._sock = parent_sock
+        threading.Thread(target=self._receive, args=(parent_sock,), daemon=True).start()
+
+    def launch(self, file_path, cwd=None):
+        """Run the script in a fresh child of the server. Returns a WarmProcess once it has forked."""
+        self.start()
+        out_read, out_write = os.pipe()
+        err_read, err_write = os.pipe()
+        with self._lock:
+            request_id = next(self._requests)
+            process = WarmProcess(self, request_id, open(out_read, "rb", 0), open(err_read, "rb", 0))
+            self._pending[request_id] = process
+            request = {"id": request_id, "file_path": os.path.abspath(file_path), "cwd": cwd}
+            try:
+                socket.send_fds(self._sock, [json.dumps(request).encode()], [out_write, err_write])
+            finally:
+                os.close(out_write)
+                os.close(err_write)
+        if not process._started.wait(LAUNCH_TIMEOUT):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            process.stdout.close()
+            process.stderr.close()
+            raise RuntimeError(f"Warm pool for {self.python} did not launch {file_path}")
+        return process
+
+    def kill(self, request_id):
+        """Kill the child running a request, unless it has already exited."""
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._sock.send(json.dumps({"kill": request_id}).encode())
+                except OSError:
+                    pass  # The server is gone; _receive kills its orphans
+
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                self._server.stdin.close()
+                self._server.wait()
+                self._server = None
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def _receive(self, sock):
+        """Dispatch the server's started/exited messages to the waiting WarmProcess handles."""
+        while True:
+            try:
+                data = sock.recv(MESSAGE_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            message = json.loads(data)
+            if message["event"] == "ready":
+                self.preloaded = message["preloaded"]
+                self._ready.set()
+                continue
+            with self._lock:
+                process = self._pending.get(message["id"])
+                if message["event"] == "exited":
+                    self._pending.pop(message["id"], None)
+            if process is None:
+                continue
+            if message["event"] == "started":
+                process.pid = message["pid"]
+                process._started.set()
+            elif message["event"] == "exited":
+                process.returncode = message["returncode"]
+                process.rusage = message["rusage"]
+                process._exited.set()
+        # The server went away; nothing will report on runs still in flight
+        with self._lock:
+            orphans = list(self._pending.values())
+            self._pending.clear()
+        for process in orphans:
+            process._kill_orphan()
+            process.returncode = -signal.SIGKILL
+            process._started.set()
+            process._exited.set()
+
+
+class WarmPoolManager:
+    """Keeps one WarmPool per interpreter."""
+
+    def __init__(self, preload=None):
+        self.preload = preload
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, python):
+        with self._lock:
+            pool = self._pools.get(python)
+            if pool is None:
+                pool = self._pools[python] = WarmPool(python, self.preload)
+        return pool
+
+    def launch(self, python, file_path, cwd=None):
+        return self.get(python).launch(file_path, cwd)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+
+# Server side: everything below runs inside the target interpreter
+
+def _run_child(request, fds, sock, wakeup_fds):
+    """Body of a forked child: run the script as __main__ and exit with its status."""
+    code = 0
+    try:
+        sock.close()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for fd in wakeup_fds:
+            os.close(fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in (devnull, *fds):
+            os.close(fd)
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        file_path = request["file_path"]
+        sys.argv = [file_path]
+        sys.path[0] = os.path.dirname(file_path)
+        # Forked children would otherwise share the server's random state
+        import random
+        random.seed()
+        if "numpy" in sys.modules:
+            sys.modules["numpy"].random.seed()
+        runpy.run_path(file_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(code)
+
+
+def _rusage_dict(rusage):
+    return {"utime": rusage.ru_utime, "stime": rusage.ru_stime, "maxrss": rusage.ru_maxrss}
+
+
+def serve(fd, preload):
+    sock = socket.socket(fileno=fd)
+    preloaded = []
+    for name in preload:
+        try:
+            importlib.import_module(name)
+            preloaded.append(name)
+        except Exception:
+            pass
+    sock.send(json.dumps({"event": "ready", "preloaded": preloaded}).encode())
+
+    children = {}  # pid -> request id
+    stdin = sys.stdin.fileno()
+    # A child exiting wakes the loop through this pipe, so its exit is reported without waiting for a reap poll
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write, warn_on_full_buffer=False)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    while True:
+        readable, _, _ = select.select([sock, stdin, wakeup_read], [], [], REAP_INTERVAL if children else None)
+        if wakeup_read in readable:
+            os.read(wakeup_read, MESSAGE_SIZE)
+        if stdin in readable and not os.read(stdin, 1024):
+            break
+        if sock in readable:
+            message, fds, _, _ = socket.recv_fds(sock, MESSAGE_SIZE, 2)
+            if not message:
+                break
+            request = json.loads(message)
+            if "kill" in request:
+                # Children are only reaped below, on this thread, so a pid found here is still ours
+                for pid, request_id in children.items():
+                    if request_id == request["kill"]:
+                        os.kill(pid, signal.SIGKILL)
+                continue
+            pid = os.fork()
+            if pid == 0:
+                _run_child(request, fds, sock, (wakeup_read, wakeup_write))
+            for received in fds:
+                os.close(received)
+            children[pid] = request["id"]
+            sock.send(json.dumps({"event": "started", "id": request["id"], "pid": pid}).encode())
+        while children:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            request_id = children.pop(pid)
+            sock.send(json.dumps({"event": "exited", "id": request_id,
+                                  "returncode": os.waitstatus_to_exitcode(status),
+                                  "rusage": _rusage_dict(rusage)}).encode())
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]), sys.argv[2:])